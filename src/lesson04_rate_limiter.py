@@ -0,0 +1,119 @@
+# SuperFastPython.com
+# example of a token bucket rate limiter shared between processes
+from time import sleep, monotonic, perf_counter
+from multiprocessing import Process
+from multiprocessing import Lock
+from multiprocessing import RawArray
+
+"""
+Semaphore vs rate limiter
+Semaphore(2) limits how many processes are inside a block at once, but not how
+often they can enter it. A token bucket limits the rate: tokens refill at `rate`
+per second up to `capacity`, and each call spends `cost` tokens.
+The bucket state is two doubles in shared memory (tokens and last refill time)
+guarded by a multiprocessing.Lock, so acquiring never goes through a manager
+process. The lock is only held for a few arithmetic operations.
+Blocking acquire reserves its tokens straight away, letting the balance go
+negative, then sleeps outside the lock until the debt is repaid. Each caller
+takes the lock once, and waiting callers queue up in arrival order instead of
+all waking up and retrying together.
+time.monotonic() reads a system-wide clock on Linux, macOS and Windows, so every
+process agrees on the refill time.
+"""
+
+class TokenBucket:
+    """Process-shared token bucket rate limiter"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._lock = Lock()
+        # tokens, last refill time
+        self._state = RawArray('d', [capacity, monotonic()])
+
+    def _refill(self, now):
+        tokens, last = self._state
+        self._state[0] = min(self.capacity, tokens + (now - last) * self.rate)
+        self._state[1] = now
+
+    def try_acquire(self, cost=1):
+        """Take cost tokens if they are available now, without waiting"""
+        with self._lock:
+            self._refill(monotonic())
+            if self._state[0] < cost:
+                return False
+            self._state[0] -= cost
+            return True
+
+    def acquire(self, cost=1, timeout=None):
+        """Take cost tokens, waiting for them if needed"""
+        if cost > self.capacity:
+            raise ValueError(f'cost {cost} exceeds capacity {self.capacity}')
+        with self._lock:
+            self._refill(monotonic())
+            wait = max(0.0, (cost - self._state[0]) / self.rate)
+            if timeout is not None and wait > timeout:
+                return False
+            # reserve now, pay back the debt while sleeping
+            self._state[0] -= cost
+        if wait > 0:
+            sleep(wait)
+        return True
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+# custom function to be executed in a child process
+def task(bucket, ident, calls, results):
+    for i in range(calls):
+        # heavier calls cost more tokens
+        bucket.acquire(cost=2 if i % 5 == 0 else 1)
+    results[ident] = monotonic()
+
+# benchmark of many processes hammering try_acquire
+def hammer(bucket, seconds, counts, ident):
+    granted = attempts = 0
+    end = perf_counter() + seconds
+    while perf_counter() < end:
+        attempts += 1
+        if bucket.try_acquire():
+            granted += 1
+    counts[ident * 2] = granted
+    counts[ident * 2 + 1] = attempts
+
+# protect the entry point
+if __name__ == '__main__':
+    # 16 processes sharing a quota of 100 tokens per second, burst of 20
+    bucket = TokenBucket(rate=100.0, capacity=20)
+    finish = RawArray('d', 16)
+    start = monotonic()
+    processes = [Process(target=task, args=(bucket, i, 20, finish))
+                 for i in range(16)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    duration = max(finish) - start
+    tokens = 16 * (16 * 1 + 4 * 2)
+    print(f'Spent {tokens} tokens in {duration:.2f}s, '
+          f'{tokens / duration:.1f} tokens/s (limit 100/s plus burst 20)')
+    # contention benchmark: non-blocking acquire from many processes
+    for workers in (8, 64, 256):
+        bucket = TokenBucket(rate=1000.0, capacity=100)
+        counts = RawArray('q', workers * 2)
+        processes = [Process(target=hammer, args=(bucket, 1.0, counts, i))
+                     for i in range(workers)]
+        start = monotonic()
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        duration = monotonic() - start
+        granted, attempts = sum(counts[0::2]), sum(counts[1::2])
+        print(f'{workers} processes: {attempts / workers:.0f} attempts per '
+              f'process-second, {granted / duration:.0f} granted/s '
+              f'(limit 1000/s)')
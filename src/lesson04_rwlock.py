@@ -0,0 +1,146 @@
+# SuperFastPython.com
+# example of a reader-writer lock shared between processes
+from time import perf_counter, monotonic
+from random import random
+from multiprocessing import Process
+from multiprocessing import Lock
+from multiprocessing import Condition
+from multiprocessing import RawArray, RawValue
+import os
+
+"""
+Lock vs reader-writer lock
+A Lock lets one process in at a time, even when every process only wants to read.
+A reader-writer lock lets any number of readers in together, and gives a writer
+the data to itself.
+Writer preference: once a writer is waiting, new readers wait too. Readers that
+are already inside finish, then the writer goes in. Without this, a steady stream
+of readers could keep a writer out forever.
+The state is three shared counters guarded by one Condition. Readers only hold
+that condition for the moment it takes to update the counters, not while they
+read.
+"""
+
+class ReadWriteLock:
+    """Process-shared reader-writer lock with writer preference"""
+
+    def __init__(self):
+        self._condition = Condition(Lock())
+        self._readers = RawValue('i', 0)
+        self._writers_waiting = RawValue('i', 0)
+        self._writer_active = RawValue('b', 0)
+
+    def acquire_read(self, timeout=None):
+        """Wait until no writer is active or waiting, then start reading"""
+        with self._condition:
+            can_read = lambda: (not self._writer_active.value
+                                and not self._writers_waiting.value)
+            if not self._condition.wait_for(can_read, timeout):
+                return False
+            self._readers.value += 1
+            return True
+
+    def release_read(self):
+        with self._condition:
+            self._readers.value -= 1
+            if self._readers.value == 0:
+                self._condition.notify_all()
+
+    def acquire_write(self, timeout=None):
+        """Wait until there are no readers and no active writer"""
+        with self._condition:
+            self._writers_waiting.value += 1
+            can_write = lambda: (not self._writer_active.value
+                                 and self._readers.value == 0)
+            acquired = self._condition.wait_for(can_write, timeout)
+            self._writers_waiting.value -= 1
+            if acquired:
+                self._writer_active.value = 1
+            else:
+                # let readers held back by this writer continue
+                self._condition.notify_all()
+            return acquired
+
+    def release_write(self):
+        with self._condition:
+            self._writer_active.value = 0
+            self._condition.notify_all()
+
+    def read_lock(self):
+        return _Guard(self.acquire_read, self.release_read)
+
+    def write_lock(self):
+        return _Guard(self.acquire_write, self.release_write)
+
+class _Guard:
+    """Context manager for one side of a ReadWriteLock"""
+
+    def __init__(self, acquire, release):
+        self._acquire = acquire
+        self._release = release
+
+    def __enter__(self):
+        self._acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._release()
+
+# plain Lock used the same way, for the benchmark
+class ExclusiveLock:
+    def __init__(self):
+        self._lock = Lock()
+
+    def read_lock(self):
+        return self._lock
+
+    def write_lock(self):
+        return self._lock
+
+# custom function to be executed in a child process
+def task(lock, table, operations, write_ratio, ident, results):
+    checksum = 0.0
+    for _ in range(operations):
+        if random() < write_ratio:
+            with lock.write_lock():
+                # rare update of the shared table
+                for i in range(len(table)):
+                    table[i] += 1.0
+        else:
+            with lock.read_lock():
+                # frequent read of the shared table
+                checksum += sum(table)
+    results[ident] = checksum
+
+def benchmark(lock, processes, operations, write_ratio):
+    table = RawArray('d', 2000)
+    results = RawArray('d', processes)
+    workers = [Process(target=task, args=(lock, table, operations,
+        write_ratio, i, results)) for i in range(processes)]
+    start = monotonic()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return monotonic() - start
+
+# protect the entry point
+if __name__ == '__main__':
+    # 99% reads across 32 processes, readers only overlap on multiple cores
+    processes, operations = 32, 500
+    print(f'{processes} processes on {os.cpu_count()} CPUs')
+    for name, lock in (('Lock', ExclusiveLock()),
+                       ('ReadWriteLock', ReadWriteLock())):
+        duration = benchmark(lock, processes, operations, write_ratio=0.01)
+        total = processes * operations
+        print(f'{name:>14}: {duration:.2f}s, {total / duration:.0f} ops/s')
+    # a writer gives up after a timeout while a reader holds the lock
+    lock = ReadWriteLock()
+    lock.acquire_read()
+    start = perf_counter()
+    acquired = lock.acquire_write(timeout=0.5)
+    print(f'Write acquired while reading: {acquired} '
+          f'(waited {perf_counter() - start:.2f}s)')
+    lock.release_read()
+    print(f'Write acquired after reader left: {lock.acquire_write(timeout=0.5)}')
+    lock.release_write()
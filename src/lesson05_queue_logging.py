@@ -0,0 +1,192 @@
+# SuperFastPython.com
+# example of a centralized, non-blocking logging pipeline for child processes
+from multiprocessing import Process, Queue, Pool, Value
+from multiprocessing.util import Finalize
+from logging import getLogger, basicConfig, makeLogRecord, Filter, Formatter
+from logging import DEBUG, WARNING
+from logging.handlers import QueueHandler
+from queue import Full, Empty
+from time import monotonic, perf_counter
+from tempfile import mkdtemp
+from shutil import rmtree
+import os
+
+"""
+Why centralize logging?
+When every child calls basicConfig() or print(..., flush=True), every message is
+its own write() system call, and children contend for the same file or terminal.
+Here the workers only put log records on a queue. A single listener process takes
+them off, formats them and writes them out in batches: one write() for up to
+batch_size records, or whatever arrived within flush_interval seconds.
+Backpressure: the queue is bounded. When it is full, records below drop_level
+(DEBUG by default) are dropped and counted rather than making the worker wait.
+More important records still block, so they are never lost. Drops are not
+silent: every report_interval seconds, and when the worker exits, the handler
+sends a WARNING record with the number of records it dropped, and the listener
+adds these up so the parent can report the total.
+Rate limiting: RateLimitFilter gives each logger a token bucket of `rate`
+records per second with a `burst` allowance. Records over the limit are dropped,
+and the next record that is let through reports how many were suppressed.
+"""
+
+class RateLimitFilter(Filter):
+    """Token bucket per logger name, applied in the worker"""
+
+    def __init__(self, rate=100.0, burst=200):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+
+    def filter(self, record):
+        now = monotonic()
+        tokens, last, suppressed = self._buckets.get(
+            record.name, (self.burst, now, 0))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        if tokens < 1:
+            self._buckets[record.name] = (tokens, now, suppressed + 1)
+            return False
+        if suppressed:
+            record.msg = f'{record.msg} [{suppressed} records suppressed]'
+        self._buckets[record.name] = (tokens - 1, now, 0)
+        return True
+
+class BackpressureQueueHandler(QueueHandler):
+    """QueueHandler that drops low-level records when the queue is full"""
+
+    def __init__(self, queue, drop_level=DEBUG, report_interval=1.0):
+        super().__init__(queue)
+        self.drop_level = drop_level
+        self.report_interval = report_interval
+        self.dropped = 0
+        self._reported = 0
+        self._next_report = monotonic() + report_interval
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            if record.levelno <= self.drop_level:
+                self.dropped += 1
+            else:
+                self.queue.put(record)
+        if self.dropped > self._reported and monotonic() >= self._next_report:
+            self.report_dropped()
+
+    def report_dropped(self):
+        """Send the number of records dropped since the last report"""
+        self._next_report = monotonic() + self.report_interval
+        count = self.dropped - self._reported
+        if not count:
+            return
+        self._reported = self.dropped
+        # blocks like any other WARNING, so the report is never dropped
+        self.queue.put(makeLogRecord({'name': 'logging.backpressure',
+            'levelno': WARNING, 'levelname': 'WARNING',
+            'msg': f'Dropped {count} records, queue full', 'dropped': count}))
+
+def log_listener(queue, filename, batch_size=512, flush_interval=0.2,
+                 dropped=None):
+    """Listener process: batch formatted records into a few large writes"""
+    formatter = Formatter('%(asctime)s - %(processName)s - %(levelname)s - '
+                          '%(message)s')
+    with open(filename, 'a') as file:
+        batch = []
+        deadline = monotonic() + flush_interval
+        while True:
+            try:
+                record = queue.get(timeout=max(0.0, deadline - monotonic()))
+            except Empty:
+                record = False
+            if record is None:
+                break
+            if record:
+                batch.append(formatter.format(record) + '\n')
+                # total the drop reports of all workers
+                if dropped is not None and hasattr(record, 'dropped'):
+                    dropped.value += record.dropped
+            if len(batch) >= batch_size or monotonic() >= deadline:
+                if batch:
+                    file.write(''.join(batch))
+                    file.flush()
+                    batch.clear()
+                deadline = monotonic() + flush_interval
+        file.write(''.join(batch))
+
+def configure_worker(queue, level=DEBUG, rate=None, burst=200):
+    """Pool initializer: send this process's log records to the queue"""
+    root = getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = BackpressureQueueHandler(queue)
+    if rate is not None:
+        handler.addFilter(RateLimitFilter(rate, burst))
+    root.addHandler(handler)
+    root.setLevel(level)
+    # report the last drops when the worker exits, before the queue's own
+    # exit hook (exitpriority 10) stops its feeder thread
+    Finalize(handler, handler.report_dropped, exitpriority=20)
+
+def configure_direct(filename):
+    """Pool initializer: every child writes to the file itself"""
+    basicConfig(filename=filename, level=DEBUG, format='%(asctime)s - '
+                '%(processName)s - %(levelname)s - %(message)s')
+
+# custom function to be executed in a child process
+def task(ident):
+    logger = getLogger(f'task.{ident % 2}')
+    for i in range(2000):
+        logger.debug(f'Task {ident} step {i}')
+        if i % 500 == 0:
+            logger.info(f'Task {ident} reached step {i}')
+    logger.warning(f'Task {ident} done')
+    return ident
+
+def run_pipeline(log_file, rate=None, burst=200):
+    """Run the tasks with the queue pipeline, return duration and drops"""
+    queue = Queue(maxsize=10000)
+    dropped = Value('i', 0)
+    listener = Process(target=log_listener,
+                       args=(queue, log_file, 512, 0.2, dropped))
+    listener.start()
+    start = perf_counter()
+    pool = Pool(4, initializer=configure_worker,
+                initargs=(queue, DEBUG, rate, burst))
+    pool.map(task, range(8))
+    # close and join so each worker flushes its queue before exiting
+    pool.close()
+    pool.join()
+    duration = perf_counter() - start
+    queue.put(None)
+    listener.join()
+    return duration, dropped.value
+
+def count_lines(filename):
+    with open(filename) as file:
+        return len(file.readlines())
+
+# protect the entry point
+if __name__ == '__main__':
+    work_dir = mkdtemp(prefix='logging-')
+    try:
+        # baseline: every child logs straight to the file
+        direct_file = os.path.join(work_dir, 'direct.log')
+        start = perf_counter()
+        pool = Pool(4, initializer=configure_direct, initargs=(direct_file,))
+        pool.map(task, range(8))
+        pool.close()
+        pool.join()
+        print(f'direct file logging: {perf_counter() - start:.2f}s, '
+              f'{count_lines(direct_file)} lines')
+        # pipeline: queue handler in the children, one listener process
+        queue_file = os.path.join(work_dir, 'queue.log')
+        duration, dropped = run_pipeline(queue_file)
+        print(f'queue logging: {duration:.2f}s, '
+              f'{count_lines(queue_file)} lines, {dropped} records dropped')
+        # pipeline with a rate limit on each logger
+        limited_file = os.path.join(work_dir, 'limited.log')
+        duration, dropped = run_pipeline(limited_file, rate=1000.0, burst=100)
+        print(f'rate limited queue logging: {duration:.2f}s, '
+              f'{count_lines(limited_file)} lines, {dropped} records dropped')
+    finally:
+        rmtree(work_dir)
@@ -0,0 +1,167 @@
+# SuperFastPython.com
+# example of a shared array that workers fill in disjoint partitions
+from multiprocessing import Pool
+from multiprocessing import Lock
+from multiprocessing.context import get_spawning_popen
+from multiprocessing.shared_memory import SharedMemory
+from contextlib import contextmanager, ExitStack
+from math import prod
+import struct
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+"""
+Sharing a large array with a pool
+Value('f') and Array('d') can only be handed to children when they are created.
+Passing the data itself to pool.map() pickles every element, twice per task.
+SharedNDArray keeps its data in a multiprocessing.shared_memory block. Pickling
+it only sends a handle (block name, shape and format), and unpickling attaches
+to the same block, so no array data is copied.
+partition() splits the first axis into Slice descriptors. pool.map() sends each
+task a descriptor, and the task calls view() to get a zero-copy view of just its
+own rows: a numpy.ndarray if NumPy is installed, otherwise a memoryview.
+Locking is optional and per region. Tasks writing disjoint slices need no lock.
+Tasks that touch shared rows can lock them with slice.lock(), which takes the
+lock of every region the slice overlaps, in ascending order.
+Locks can only be inherited, so pass the array to the pool initializer
+register(). Workers then use that inherited copy, with its locks, whenever a
+descriptor refers to the array.
+"""
+
+# arrays inherited through register() or attached by this worker
+_registry = {}
+
+def register(array):
+    """Pool initializer: keep the inherited array, with its locks"""
+    _registry[array.name] = array
+
+def _attach(name, shape, format, locks):
+    if locks is not None:
+        return SharedNDArray(shape, format, name=name, locks=locks)
+    # attach once per worker, not once per task
+    if name not in _registry:
+        _registry[name] = SharedNDArray(shape, format, name=name)
+    return _registry[name]
+
+class SharedNDArray:
+    """N-dimensional array in shared memory, pickled by handle"""
+
+    def __init__(self, shape, format='d', region_locks=0, name=None,
+                 locks=None):
+        self.shape = tuple(shape)
+        self.format = format
+        self.itemsize = struct.calcsize(format)
+        self._owner = name is None
+        if self._owner:
+            self._shm = SharedMemory(create=True,
+                size=max(1, self.itemsize * prod(self.shape)))
+            locks = [Lock() for _ in range(region_locks)]
+        else:
+            # workers share the parent's resource tracker, and only the
+            # creating process unlinks the block in close()
+            self._shm = SharedMemory(name=name)
+        self.name = self._shm.name
+        self.locks = locks or []
+
+    def __reduce__(self):
+        # locks may only be pickled while a child process is being created
+        locks = self.locks if get_spawning_popen() is not None else None
+        return _attach, (self.name, self.shape, self.format, locks)
+
+    def view(self, start=0, stop=None):
+        """Zero-copy view of rows start to stop"""
+        stop = self.shape[0] if stop is None else stop
+        row_bytes = self.itemsize * prod(self.shape[1:])
+        buffer = self._shm.buf[start * row_bytes:stop * row_bytes]
+        shape = (stop - start,) + self.shape[1:]
+        if np is not None:
+            return np.ndarray(shape, dtype=self.format, buffer=buffer)
+        return buffer.cast(self.format, shape)
+
+    def partition(self, parts):
+        """Split the first axis into parts Slice descriptors"""
+        rows = self.shape[0]
+        bounds = [rows * i // parts for i in range(parts + 1)]
+        return [Slice(self, start, stop)
+                for start, stop in zip(bounds, bounds[1:]) if stop > start]
+
+    @contextmanager
+    def region_locks(self, start, stop):
+        """Hold the lock of every region that rows start to stop overlap"""
+        with ExitStack() as stack:
+            if self.locks and stop > start:
+                first = start * len(self.locks) // self.shape[0]
+                last = (stop - 1) * len(self.locks) // self.shape[0]
+                # always in ascending order, so two slices can't deadlock
+                for lock in self.locks[first:last + 1]:
+                    stack.enter_context(lock)
+            yield
+
+    def close(self):
+        """Detach, and free the block if this process created it"""
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+class Slice:
+    """Descriptor for rows start to stop of a SharedNDArray"""
+
+    def __init__(self, array, start, stop):
+        self.array = array
+        self.start = start
+        self.stop = stop
+
+    def view(self):
+        return self.array.view(self.start, self.stop)
+
+    def lock(self):
+        return self.array.region_locks(self.start, self.stop)
+
+# custom function to be executed in a child process
+def fill(part):
+    view = part.view()
+    columns = part.array.shape[1]
+    # each task writes only its own rows, no lock needed
+    for row in range(part.stop - part.start):
+        for column in range(columns):
+            view[row, column] = (part.start + row) * columns + column
+    del view
+    return part.start, part.stop
+
+def scale(part, factor=0.5):
+    view = part.view()
+    # take the region lock in case other tasks share these rows
+    with part.lock():
+        for row in range(part.stop - part.start):
+            for column in range(part.array.shape[1]):
+                view[row, column] *= factor
+    del view
+
+def total(array):
+    view = array.view()
+    result = sum(view[row, column] for row in range(array.shape[0])
+                 for column in range(array.shape[1]))
+    del view
+    return result
+
+# protect the entry point
+if __name__ == '__main__':
+    print(f'Views are {"numpy.ndarray" if np is not None else "memoryview"}')
+    with SharedNDArray((400, 250), 'd', region_locks=4) as array:
+        with Pool(4, initializer=register, initargs=(array,)) as pool:
+            # each task receives a small descriptor, not the data
+            parts = array.partition(8)
+            for start, stop in pool.map(fill, parts):
+                print(f'Filled rows {start}-{stop}')
+            pool.map(scale, parts)
+        rows, columns = array.shape
+        expected = 0.5 * (rows * columns - 1) * rows * columns / 2
+        print(f'Total: {total(array)}, expected: {expected}')
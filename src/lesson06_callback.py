@@ -12,6 +12,7 @@ Callback Location: The callback runs in the same process that created the Pool a
 Process Isolation: Each process has its own memory space, so callbacks are isolated to their creating process
 No Cross-Process Callbacks: A callback cannot be executed by a different process than the one that submitted the task
 Pool Scope: Each Pool is tied to the process that created it
+Callback Thread: Within the parent, callbacks run on the pool's single result-handler thread, so a slow callback delays every other result (see process_executor_callback_dispatch.py)
 """
 def result_callback(return_value):
     print(f"In callback,current process: {current_process()}")
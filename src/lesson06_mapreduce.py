@@ -0,0 +1,159 @@
+# SuperFastPython.com
+# example of a local mapreduce engine built on the multiprocessing pool
+from multiprocessing import Pool
+from tempfile import mkdtemp
+from shutil import rmtree
+from random import choice, seed
+from time import perf_counter
+from zlib import crc32
+import pickle
+import os
+
+"""
+How the engine works
+Map: each map task runs the mapper over its split of the input and folds the
+(key, value) pairs into a dict with the combiner, so only one value per key
+leaves the task. When the dict holds more than max_keys keys it is spilled.
+Shuffle: a spill writes each key to the bucket file of reducer
+crc32(encoding of the key) % reducers. The built-in hash() can't be used for
+this, because str hashes are randomized per process and the workers would
+disagree. pickle can't be used either: equal keys such as 1 and 1.0 pickle
+differently, and so can equal tuples. Keys must be str, bytes, int, bool,
+float, or tuples of these, and each is encoded so that equal keys give the same
+bytes. Other key types raise TypeError.
+Reduce: each reducer streams its bucket files and folds the values for each key
+with the reducer function, so only one value per key of its partition is held in
+memory.
+The combiner and reducer are fold functions f(a, b) -> c. They must be
+associative, like sum or max, because values are combined in any order.
+"""
+
+def encode_key(key):
+    """Bytes that depend only on the key's value, so equal keys match"""
+    if isinstance(key, str):
+        return b's' + key.encode('utf-8', 'surrogatepass')
+    if isinstance(key, bytes):
+        return b'b' + key
+    # 1.0 == 1 == True, so they must encode the same
+    if isinstance(key, float) and key.is_integer():
+        key = int(key)
+    if isinstance(key, int):
+        return b'i' + str(int(key)).encode()
+    if isinstance(key, float):
+        return b'f' + key.hex().encode()
+    if isinstance(key, tuple):
+        parts = [encode_key(item) for item in key]
+        return b't' + b''.join(b'%d:%s' % (len(part), part) for part in parts)
+    raise TypeError(f'unsupported mapreduce key type: {type(key).__name__}')
+
+def partition(key, reducers):
+    """Pick the reducer for a key, the same in every process"""
+    return crc32(encode_key(key)) % reducers
+
+def spill(work_dir, task_id, spill_id, combined, reducers):
+    """Write combined pairs to one bucket file per reducer"""
+    buckets = [[] for _ in range(reducers)]
+    for key, value in combined.items():
+        buckets[partition(key, reducers)].append((key, value))
+    for reducer_id, pairs in enumerate(buckets):
+        if not pairs:
+            continue
+        path = os.path.join(work_dir, f'bucket-{reducer_id}')
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, f'map-{task_id}-{spill_id}.pkl'), 'wb') as file:
+            pickle.dump(pairs, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+def map_task(args):
+    """Run the mapper and combiner over one input split"""
+    task_id, split, mapper, combiner, reducers, max_keys, work_dir = args
+    combined = {}
+    spills = 0
+    for record in split:
+        for key, value in mapper(record):
+            if key in combined:
+                combined[key] = combiner(combined[key], value)
+            else:
+                combined[key] = value
+            # bound memory by spilling to the bucket files
+            if len(combined) >= max_keys:
+                spill(work_dir, task_id, spills, combined, reducers)
+                combined.clear()
+                spills += 1
+    if combined:
+        spill(work_dir, task_id, spills, combined, reducers)
+        spills += 1
+    return spills
+
+def reduce_task(args):
+    """Fold every value for each key in one reducer's bucket"""
+    reducer_id, reducer, work_dir = args
+    path = os.path.join(work_dir, f'bucket-{reducer_id}')
+    result = {}
+    if not os.path.isdir(path):
+        return result
+    for name in sorted(os.listdir(path)):
+        with open(os.path.join(path, name), 'rb') as file:
+            for key, value in pickle.load(file):
+                if key in result:
+                    result[key] = reducer(result[key], value)
+                else:
+                    result[key] = value
+    return result
+
+def map_reduce(pool, data, mapper, reducer, combiner=None, reducers=4,
+               splits=None, max_keys=10000):
+    """Run a mapreduce job on the pool and return a dict of results"""
+    combiner = combiner or reducer
+    splits = splits or reducers * 2
+    step = max(1, -(-len(data) // splits))
+    work_dir = mkdtemp(prefix='mapreduce-')
+    try:
+        map_args = [(task_id, data[i:i + step], mapper, combiner, reducers,
+                     max_keys, work_dir)
+                    for task_id, i in enumerate(range(0, len(data), step))]
+        pool.map(map_task, map_args)
+        reduce_args = [(reducer_id, reducer, work_dir)
+                       for reducer_id in range(reducers)]
+        result = {}
+        for partial in pool.map(reduce_task, reduce_args):
+            # equal keys always share a reducer, but fold them to be safe
+            for key, value in partial.items():
+                if key in result:
+                    result[key] = reducer(result[key], value)
+                else:
+                    result[key] = value
+        return result
+    finally:
+        rmtree(work_dir)
+
+# mapper for a word count, emits (word, 1)
+def word_mapper(line):
+    for word in line.split():
+        yield word, 1
+
+# combiner and reducer for a word count
+def add(a, b):
+    return a + b
+
+# protect the entry point
+if __name__ == '__main__':
+    # generate some text to count
+    seed(1)
+    vocabulary = [f'word{i}' for i in range(5000)]
+    lines = [' '.join(choice(vocabulary) for _ in range(20))
+             for _ in range(50000)]
+    # serial aggregation in the parent
+    start = perf_counter()
+    serial = {}
+    for line in lines:
+        for word, one in word_mapper(line):
+            serial[word] = serial.get(word, 0) + one
+    print(f'Serial: {len(serial)} keys in {perf_counter() - start:.2f}s')
+    # the same job as mapreduce on the pool
+    with Pool(4) as pool:
+        start = perf_counter()
+        counts = map_reduce(pool, lines, word_mapper, add, reducers=4,
+            max_keys=2000)
+        print(f'MapReduce: {len(counts)} keys in '
+              f'{perf_counter() - start:.2f}s')
+    print(f'Results match: {counts == serial}')
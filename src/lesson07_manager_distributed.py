@@ -0,0 +1,249 @@
+# SuperFastPython.com
+# example of a multi-host work queue served by a manager over TCP
+from concurrent.futures import Future
+from multiprocessing import Process
+from multiprocessing.managers import BaseManager
+from threading import Thread, Lock, Condition, Event
+from collections import deque
+from itertools import count
+from time import sleep, monotonic
+from socket import gethostname
+from uuid import uuid4
+import pickle
+import os
+
+"""
+How the distributed mode works
+A coordinator process runs a BaseManager server on a TCP address. It serves one
+Broker object that holds the pending tasks, the tasks leased to each node, and
+the finished results.
+Worker nodes can run on any host that can reach the address. Each node connects,
+takes tasks in batches with get_batch(), runs them, and sends the results back
+with complete(). A heartbeat thread calls heartbeat() every second. If a node
+misses heartbeats for node_timeout seconds, the broker puts its leased tasks
+back at the front of the pending queue. A late result from a node that was
+given up on is ignored.
+The client, DistributedExecutor, keeps the submit/map API and returns
+concurrent.futures.Future objects. Tasks travel as pickled (fn, args, kwargs),
+so fn must be importable on the worker nodes.
+Several clients can share one coordinator. Each client has a random id, its task
+ids are (client id, sequence number), and the broker keeps one result queue per
+client, so a client only ever takes its own results.
+Every party must use the same authkey. The manager connection is not encrypted,
+so only use it on a trusted network.
+"""
+
+class Broker:
+    """Task and result queues with leases, living in the manager process"""
+
+    def __init__(self, node_timeout=3.0):
+        self.node_timeout = node_timeout
+        self._pending = deque()
+        self._leases = {}
+        self._nodes = {}
+        self._results = {}
+        self._changed = Condition(Lock())
+        Thread(target=self._reap, daemon=True).start()
+
+    def put_task(self, task_id, payload):
+        with self._changed:
+            self._pending.append((task_id, payload))
+            self._changed.notify_all()
+
+    def get_batch(self, node_id, size, timeout=1.0):
+        """Lease up to size tasks to a node, waiting up to timeout for one"""
+        with self._changed:
+            self._nodes[node_id] = monotonic()
+            self._changed.wait_for(lambda: self._pending, timeout)
+            batch = []
+            while self._pending and len(batch) < size:
+                task_id, payload = self._pending.popleft()
+                self._leases[task_id] = (node_id, payload)
+                batch.append((task_id, payload))
+            return batch
+
+    def heartbeat(self, node_id):
+        with self._changed:
+            self._nodes[node_id] = monotonic()
+
+    def complete(self, node_id, results):
+        with self._changed:
+            for task_id, ok, data in results:
+                lease = self._leases.get(task_id)
+                # drop results for tasks this node no longer holds
+                if lease is None or lease[0] != node_id:
+                    continue
+                del self._leases[task_id]
+                client_id = task_id[0]
+                client_results = self._results.setdefault(client_id, deque())
+                client_results.append((task_id, ok, data))
+            self._changed.notify_all()
+
+    def take_results(self, client_id, timeout=1.0):
+        """Take the finished results of one client's tasks"""
+        with self._changed:
+            self._changed.wait_for(lambda: self._results.get(client_id),
+                                   timeout)
+            return list(self._results.pop(client_id, ()))
+
+    def stats(self):
+        with self._changed:
+            return {'pending': len(self._pending), 'leased': len(self._leases),
+                    'nodes': sorted(self._nodes)}
+
+    def _reap(self):
+        while True:
+            sleep(self.node_timeout / 3)
+            with self._changed:
+                now = monotonic()
+                dead = [node for node, seen in self._nodes.items()
+                        if now - seen > self.node_timeout]
+                for node in dead:
+                    del self._nodes[node]
+                    requeue = [(task_id, payload) for task_id, (owner, payload)
+                               in self._leases.items() if owner == node]
+                    for task_id, payload in reversed(requeue):
+                        del self._leases[task_id]
+                        self._pending.appendleft((task_id, payload))
+                    print(f'Broker: node {node} died, requeued '
+                          f'{len(requeue)} tasks', flush=True)
+                if dead:
+                    self._changed.notify_all()
+
+# one broker per manager server process
+_broker = None
+
+def _get_broker():
+    global _broker
+    if _broker is None:
+        _broker = Broker()
+    return _broker
+
+class BrokerManager(BaseManager):
+    pass
+
+BrokerManager.register('broker', callable=_get_broker)
+
+def start_coordinator(address, authkey):
+    """Start the manager server in a child process and return it"""
+    manager = BrokerManager(address=address, authkey=authkey)
+    manager.start()
+    return manager
+
+def connect(address, authkey):
+    manager = BrokerManager(address=address, authkey=authkey)
+    manager.connect()
+    return manager.broker()
+
+def _pack(ok, value):
+    """Pickle a result, or the error if it can't be pickled"""
+    try:
+        return ok, pickle.dumps(value)
+    except Exception as e:
+        try:
+            return False, pickle.dumps(e)
+        except Exception:
+            return False, pickle.dumps(RuntimeError(repr(e)))
+
+def run_node(address, authkey, batch_size=4, node_id=None):
+    """Worker node: pull batches from the broker until the process is stopped"""
+    node_id = node_id or f'{gethostname()}-{os.getpid()}'
+    broker = connect(address, authkey)
+
+    def beat():
+        # each thread needs its own proxy connection
+        proxy = connect(address, authkey)
+        while True:
+            proxy.heartbeat(node_id)
+            sleep(1.0)
+
+    Thread(target=beat, daemon=True).start()
+    while True:
+        results = []
+        for task_id, payload in broker.get_batch(node_id, batch_size):
+            try:
+                fn, args, kwargs = pickle.loads(payload)
+                outcome = _pack(True, fn(*args, **kwargs))
+            except Exception as e:
+                outcome = _pack(False, e)
+            results.append((task_id,) + outcome)
+        if results:
+            broker.complete(node_id, results)
+
+class DistributedExecutor:
+    """submit/map client for the broker"""
+
+    def __init__(self, address, authkey):
+        self._broker = connect(address, authkey)
+        self._results_broker = connect(address, authkey)
+        self._futures = {}
+        self.client_id = uuid4().hex
+        self._ids = count()
+        self._lock = Lock()
+        self._stop = Event()
+        self._collector = Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        task_id = (self.client_id, next(self._ids))
+        with self._lock:
+            self._futures[task_id] = future
+        self._broker.put_task(task_id, pickle.dumps((fn, args, kwargs)))
+        return future
+
+    def map(self, fn, *iterables):
+        futures = [self.submit(fn, *args) for args in zip(*iterables)]
+        return (future.result() for future in futures)
+
+    def _collect(self):
+        while not self._stop.is_set():
+            results = self._results_broker.take_results(self.client_id, 0.5)
+            for task_id, ok, data in results:
+                with self._lock:
+                    future = self._futures.pop(task_id, None)
+                if future is None:
+                    continue
+                value = pickle.loads(data)
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    def shutdown(self):
+        self._stop.set()
+        self._collector.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+# task executed on a worker node
+def remote_task(task_id):
+    sleep(0.2)
+    return task_id, os.getpid()
+
+# protect the entry point
+if __name__ == '__main__':
+    address, authkey = ('127.0.0.1', 50123), b'jump-start'
+    coordinator = start_coordinator(address, authkey)
+    # three worker nodes on localhost
+    nodes = [Process(target=run_node, args=(address, authkey, 2), daemon=True)
+             for _ in range(3)]
+    for node in nodes:
+        node.start()
+    with DistributedExecutor(address, authkey) as executor:
+        futures = [executor.submit(remote_task, i) for i in range(30)]
+        # kill one node part way through, its tasks are requeued
+        sleep(1)
+        nodes[0].kill()
+        print(f'Killed node process {nodes[0].pid}')
+        results = [future.result() for future in futures]
+    pids = sorted({pid for _, pid in results})
+    print(f'{len(results)} results, in order: '
+          f'{[i for i, _ in results] == list(range(30))}, from nodes {pids}')
+    for node in nodes[1:]:
+        node.kill()
+    coordinator.shutdown()
@@ -0,0 +1,163 @@
+# SuperFastPython.com
+# example of pinning worker processes to cores and NUMA nodes
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Process, Value
+from multiprocessing.shared_memory import SharedMemory
+from glob import glob
+from time import perf_counter
+import mmap
+import os
+from process_executor_examples import cpu_bound_task
+
+"""
+Why pin workers?
+The OS scheduler is free to move a worker to any core at any time. Every move
+leaves the worker's warm caches behind, and on a multi-socket host it can leave
+the worker on one socket while its memory sits on the other.
+placement_plan() reads the NUMA layout from /sys/devices/system/node and gives
+each worker a CPU set:
+  'core': one CPU per worker, filling one node before the next
+  'node': every CPU of one node per worker, with workers spread over the nodes
+Pool workers claim the next slot of the plan from a shared counter in the pool
+initializer and pin themselves with os.sched_setaffinity(). PinnedProcess does
+the same for a single Process.
+Memory placement: Linux puts each page on the NUMA node of the CPU that first
+writes to it ("first touch"). The standard library has no binding to
+set_mempolicy(), so local_buffer() relies on first touch: a pinned worker
+creates the shared memory block and writes one byte per page, so every page
+lands on that worker's node.
+sched_setaffinity() is only available on Linux. Elsewhere the plan is ignored
+and workers run unpinned.
+"""
+
+def parse_cpulist(text):
+    """Parse a kernel cpulist such as '0-3,8-11' into a list of CPUs"""
+    cpus = []
+    for part in text.strip().split(','):
+        if not part:
+            continue
+        start, _, end = part.partition('-')
+        cpus.extend(range(int(start), int(end or start) + 1))
+    return cpus
+
+def numa_nodes():
+    """Map NUMA node id to the CPUs this process may use on it"""
+    allowed = (os.sched_getaffinity(0) if hasattr(os, 'sched_getaffinity')
+               else set(range(os.cpu_count() or 1)))
+    nodes = {}
+    for path in sorted(glob('/sys/devices/system/node/node[0-9]*/cpulist')):
+        node = int(os.path.basename(os.path.dirname(path))[4:])
+        with open(path) as file:
+            cpus = [cpu for cpu in parse_cpulist(file.read()) if cpu in allowed]
+        if cpus:
+            nodes[node] = cpus
+    return nodes or {0: sorted(allowed)}
+
+def placement_plan(workers, mode='core'):
+    """Return one CPU set per worker"""
+    nodes = numa_nodes()
+    if mode == 'core':
+        cpus = [cpu for node in sorted(nodes) for cpu in nodes[node]]
+        return [{cpus[i % len(cpus)]} for i in range(workers)]
+    if mode == 'node':
+        order = sorted(nodes)
+        return [set(nodes[order[i % len(order)]]) for i in range(workers)]
+    raise ValueError(f'unknown placement mode {mode!r}')
+
+def pin(cpus):
+    """Pin the calling process to cpus, where the OS supports it"""
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+
+def _pin_worker(counter, plan):
+    """Pool initializer: claim the next slot of the plan and pin to it"""
+    with counter.get_lock():
+        slot = counter.value
+        counter.value += 1
+    pin(plan[slot % len(plan)])
+
+def pinned_executor(max_workers, mode='core'):
+    """ProcessPoolExecutor whose workers are pinned by placement_plan()"""
+    plan = placement_plan(max_workers, mode)
+    return ProcessPoolExecutor(max_workers=max_workers,
+        initializer=_pin_worker, initargs=(Value('i', 0), plan))
+
+class PinnedProcess(Process):
+    """Process that pins itself to cpus before running its target"""
+
+    def __init__(self, cpus, **kwargs):
+        super().__init__(**kwargs)
+        self.cpus = cpus
+
+    def run(self):
+        pin(self.cpus)
+        super().run()
+
+def local_buffer(size):
+    """Create shared memory whose pages are placed by the calling process"""
+    shm = SharedMemory(create=True, size=size)
+    # first touch: writing each page allocates it on this CPU's node
+    for offset in range(0, size, mmap.PAGESIZE):
+        shm.buf[offset] = 0
+    return shm
+
+# task executed in a worker process
+def where_am_i(_):
+    """Report the CPUs this worker may run on"""
+    if not hasattr(os, 'sched_getaffinity'):
+        return os.getpid(), ()
+    return os.getpid(), tuple(sorted(os.sched_getaffinity(0)))
+
+def local_buffer_task(size):
+    """Allocate and use a buffer on this worker's NUMA node"""
+    shm = local_buffer(size)
+    try:
+        total = 0
+        for offset in range(0, size, mmap.PAGESIZE):
+            total += shm.buf[offset]
+        return shm.name, total
+    finally:
+        shm.close()
+        shm.unlink()
+
+def throughput(executor, tasks, n):
+    start = perf_counter()
+    list(executor.map(cpu_bound_task, [n] * tasks))
+    return tasks / (perf_counter() - start)
+
+# Example 1: the placement plan and where workers end up
+def placement_example():
+    print('=== Placement Example ===')
+    nodes = numa_nodes()
+    print(f'NUMA nodes: {nodes}')
+    print(f'core plan: {placement_plan(4, "core")}')
+    print(f'node plan: {placement_plan(4, "node")}')
+    with pinned_executor(4, 'core') as executor:
+        for pid, cpus in sorted(set(executor.map(where_am_i, range(8)))):
+            print(f'  worker {pid} pinned to {list(cpus)}')
+        names = list(executor.map(local_buffer_task, [1024 * 1024] * 4))
+        print(f'  allocated {len(names)} node-local buffers')
+    # a single pinned Process
+    process = PinnedProcess(placement_plan(1)[0], target=print,
+        args=('  PinnedProcess running',))
+    process.start()
+    process.join()
+    print()
+
+# Example 2: pinned vs unpinned throughput
+def benchmark_example(tasks=16, n=300000):
+    print('=== Pinned vs Unpinned Benchmark ===')
+    # one worker per usable CPU
+    workers = sum(len(cpus) for cpus in numa_nodes().values())
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        unpinned = throughput(executor, tasks, n)
+    with pinned_executor(workers, 'core') as executor:
+        pinned = throughput(executor, tasks, n)
+    print(f'{workers} workers, unpinned: {unpinned:.1f} tasks/s, '
+          f'pinned: {pinned:.1f} tasks/s')
+    print()
+
+# protect the entry point
+if __name__ == '__main__':
+    placement_example()
+    benchmark_example()
@@ -0,0 +1,264 @@
+# SuperFastPython.com
+# example of process workers that each run many coroutine tasks at once
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import Process, Queue
+from multiprocessing.connection import wait
+from threading import Thread, Lock, Condition, BoundedSemaphore
+from collections import deque
+from itertools import count
+from time import sleep, perf_counter
+import asyncio
+import inspect
+import pickle
+import os
+
+"""
+One task per worker vs many
+A ProcessPoolExecutor worker runs one task at a time. With 4 workers, only 4
+sleep() or network waits can be in flight, however long they are.
+AsyncWorkerPool starts processes that each run an asyncio event loop. A worker
+takes up to `concurrency` async def tasks at once and runs them all on its loop,
+so processes give CPU parallelism and each loop holds thousands of waits.
+Each worker has a reader thread that takes tasks off the shared task queue and
+hands them to the loop with run_coroutine_threadsafe(). The reader first
+acquires a slot from a semaphore of size `concurrency`, and the slot is released
+when the task finishes. A busy worker therefore stops taking tasks, and they go
+to the other workers instead.
+submit() returns a concurrent.futures.Future, so result(), exception(),
+add_done_callback() and as_completed() work as they do with
+ProcessPoolExecutor. Plain functions are accepted too, but they run on the loop
+and block it, so keep them short.
+As with ProcessPoolExecutor, submitted tasks wait in the parent and are only
+put on the task queue while fewer than max_workers * concurrency are in flight.
+A future is marked running when its task is put on the queue, so a task still
+waiting in the parent can be cancelled.
+Every task posts a result, even if it raises CancelledError or its result can't
+be pickled: the worker pickles the result itself and sends the error instead if
+that fails. If a worker dies, the pool is broken as with ProcessPoolExecutor:
+every pending future fails with BrokenProcessPool, and so does submit().
+"""
+
+def _pack(ok, value):
+    """Pickle a result, or the error if it can't be pickled"""
+    try:
+        return ok, pickle.dumps(value)
+    except Exception as e:
+        try:
+            return False, pickle.dumps(e)
+        except Exception:
+            return False, pickle.dumps(RuntimeError(repr(e)))
+
+def _worker(tasks, results, concurrency):
+    """Worker process: run tasks on an event loop, up to concurrency at once"""
+    loop = asyncio.new_event_loop()
+    slots = BoundedSemaphore(concurrency)
+
+    async def run(task_id, payload):
+        try:
+            fn, args, kwargs = pickle.loads(payload)
+            value = fn(*args, **kwargs)
+            if inspect.isawaitable(value):
+                value = await value
+            results.put((task_id,) + _pack(True, value))
+        except BaseException as e:
+            # CancelledError and friends are BaseException
+            results.put((task_id,) + _pack(False, e))
+            # only propagate if this task itself is being cancelled
+            if asyncio.current_task().cancelling():
+                raise
+        finally:
+            slots.release()
+
+    def reader():
+        while True:
+            slots.acquire()
+            item = tasks.get()
+            if item is None:
+                break
+            asyncio.run_coroutine_threadsafe(run(*item), loop)
+        # wait for running tasks, then stop the loop
+        for _ in range(concurrency - 1):
+            slots.acquire()
+        loop.call_soon_threadsafe(loop.stop)
+
+    Thread(target=reader, daemon=True).start()
+    loop.run_forever()
+    loop.close()
+
+class AsyncWorkerPool:
+    """Process pool whose workers each multiplex many coroutine tasks"""
+
+    def __init__(self, max_workers=None, concurrency=100):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.concurrency = concurrency
+        self._tasks = Queue()
+        self._results = Queue()
+        self._futures = {}
+        self._ids = count()
+        self._lock = Lock()
+        # tasks not yet on the task queue, and how many are on it or running
+        self._pending = deque()
+        self._in_flight = 0
+        self._dispatched = Condition(self._lock)
+        self._broken = None
+        self._shutting_down = False
+        self._workers = [Process(target=_worker, daemon=True,
+            args=(self._tasks, self._results, concurrency))
+            for _ in range(self.max_workers)]
+        for worker in self._workers:
+            worker.start()
+        self._collector = Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def submit(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) in a worker and return a Future"""
+        future = Future()
+        # pickle here, so errors reach the future and not the feeder thread
+        try:
+            payload = pickle.dumps((fn, args, kwargs))
+        except Exception as e:
+            future.set_exception(e)
+            return future
+        task_id = next(self._ids)
+        with self._lock:
+            if self._broken is not None:
+                raise BrokenProcessPool(self._broken)
+            self._futures[task_id] = future
+            self._pending.append((task_id, payload))
+            self._dispatch()
+        return future
+
+    def _dispatch(self):
+        # called with the lock held
+        while self._pending and self._in_flight < (self.max_workers
+                                                   * self.concurrency):
+            task_id, payload = self._pending.popleft()
+            # False if the future was cancelled while it waited
+            if not self._futures[task_id].set_running_or_notify_cancel():
+                del self._futures[task_id]
+                continue
+            self._in_flight += 1
+            self._tasks.put((task_id, payload))
+        if not self._pending:
+            self._dispatched.notify_all()
+
+    def map(self, fn, *iterables):
+        futures = [self.submit(fn, *args) for args in zip(*iterables)]
+        return (future.result() for future in futures)
+
+    def _collect(self):
+        reader = self._results._reader
+        sentinels = {worker.sentinel: worker for worker in self._workers}
+        while True:
+            ready = wait([reader, *sentinels])
+            if reader in ready:
+                item = self._results.get()
+                if item is None:
+                    break
+                self._handle(*item)
+                continue
+            for sentinel in ready:
+                worker = sentinels.pop(sentinel)
+                worker.join()
+                if not self._shutting_down:
+                    self._break(f'worker {worker.pid} died with exit code '
+                                f'{worker.exitcode}')
+
+    def _handle(self, task_id, ok, data):
+        with self._lock:
+            self._in_flight -= 1
+            self._dispatch()
+            future = self._futures.pop(task_id, None)
+        if future is None:
+            return
+        try:
+            value = pickle.loads(data)
+        except Exception as e:
+            ok, value = False, e
+        if ok:
+            future.set_result(value)
+        else:
+            future.set_exception(value)
+
+    def _break(self, reason):
+        """Fail every pending future, as ProcessPoolExecutor does"""
+        # results the worker sent before it died
+        while self._results._reader.poll():
+            item = self._results.get()
+            if item is None:
+                # shutdown is waiting for the collector to see this
+                self._results.put(None)
+                break
+            self._handle(*item)
+        with self._lock:
+            self._broken = reason
+            futures = list(self._futures.values())
+            self._futures.clear()
+            self._pending.clear()
+            self._dispatched.notify_all()
+        for future in futures:
+            # a waiting task may be cancelled, the rest are failed
+            if future.running() or future.set_running_or_notify_cancel():
+                future.set_exception(BrokenProcessPool(reason))
+
+    def shutdown(self):
+        # the workers stop at the first sentinel, so send waiting tasks first
+        with self._lock:
+            self._dispatched.wait_for(
+                lambda: not self._pending or self._broken is not None)
+        self._shutting_down = True
+        if self._broken is not None:
+            # a dead worker may hold the task queue's lock, so the others
+            # can't be told to stop
+            for worker in self._workers:
+                worker.terminate()
+            self._tasks.cancel_join_thread()
+        else:
+            for _ in self._workers:
+                self._tasks.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._results.put(None)
+        self._collector.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+# tasks executed in a worker process
+async def async_basic_task(task_id):
+    """Coroutine version of basic_task: one second of waiting"""
+    await asyncio.sleep(1)
+    return task_id * 2
+
+def blocking_basic_task(task_id):
+    """Blocking version for comparison"""
+    sleep(1)
+    return task_id * 2
+
+async def failing_task(task_id):
+    await asyncio.sleep(0.1)
+    raise ValueError(f'Task {task_id} failed intentionally')
+
+# Example: 4 workers with 1000 one-second waits
+def async_workers_example():
+    print('=== Async Workers Example ===')
+    start = perf_counter()
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        list(executor.map(blocking_basic_task, range(8)))
+    print(f'ProcessPoolExecutor: 8 waits in {perf_counter() - start:.2f}s')
+    start = perf_counter()
+    with AsyncWorkerPool(max_workers=4, concurrency=500) as pool:
+        results = list(pool.map(async_basic_task, range(1000)))
+        print(f'AsyncWorkerPool: {len(results)} waits in '
+              f'{perf_counter() - start:.2f}s')
+        future = pool.submit(failing_task, 3)
+        print(f'Exception: {future.exception()}')
+    print()
+
+# protect the entry point
+if __name__ == '__main__':
+    async_workers_example()
@@ -0,0 +1,192 @@
+# SuperFastPython.com
+# example of an asyncio-native front end for a process pool
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import Array
+from time import sleep, perf_counter
+from statistics import mean, quantiles
+import asyncio
+import os
+
+"""
+Why not run_in_executor?
+A common pattern is loop.run_in_executor(None, lambda: process_future.result()),
+which parks a thread from the default thread pool on every call just to wait on
+the process future. That is an extra thread hop per task, and nothing limits how
+many tasks are in flight.
+AsyncProcessPool wraps the process future directly with asyncio.wrap_future(), so
+the result is delivered straight to the event loop. A semaphore bounds the number
+of tasks in flight, and every in-flight task owns one slot in a shared array of
+cancel flags that the worker can poll with cancelled().
+"""
+
+# cancel flags shared with the workers, one per in-flight slot
+_cancel_flags = None
+# slot of the task running in this worker
+_current_slot = None
+
+def _init_worker(flags):
+    """Store the shared cancel flags in each worker"""
+    global _cancel_flags
+    _cancel_flags = flags
+
+def _run_in_slot(slot, fn, args, kwargs):
+    """Run fn in the worker with its cancel slot recorded"""
+    global _current_slot
+    _current_slot = slot
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _current_slot = None
+
+def cancelled():
+    """Return True if the task running in this worker was cancelled"""
+    if _cancel_flags is None or _current_slot is None:
+        return False
+    return bool(_cancel_flags[_current_slot])
+
+class AsyncProcessPool:
+    """Process pool with an awaitable submit and bounded concurrency"""
+
+    def __init__(self, max_workers=None, max_in_flight=32):
+        self.max_in_flight = max_in_flight
+        self._flags = Array('b', max_in_flight, lock=False)
+        self._executor = ProcessPoolExecutor(max_workers=max_workers,
+            initializer=_init_worker, initargs=(self._flags,))
+        self._free_slots = list(range(max_in_flight))
+        self._semaphore = None
+
+    async def submit(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) in a worker and await the result"""
+        if self._semaphore is None:
+            # created lazily so it binds to the running event loop
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        async with self._semaphore:
+            slot = self._free_slots.pop()
+            self._flags[slot] = 0
+            future = self._executor.submit(_run_in_slot, slot, fn, args, kwargs)
+            try:
+                return await asyncio.wrap_future(future)
+            except asyncio.CancelledError:
+                # a queued task is dropped, a running task is told to stop
+                if not future.cancel():
+                    self._flags[slot] = 1
+                    await asyncio.wait([asyncio.wrap_future(future)])
+                raise
+            finally:
+                self._free_slots.append(slot)
+
+    async def as_completed(self, fn, iterable):
+        """Yield results in completion order"""
+        tasks = {asyncio.ensure_future(self.submit(fn, arg)): arg
+                 for arg in iterable}
+        try:
+            for done in asyncio.as_completed(tasks):
+                yield await done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def imap(self, fn, iterable, window=None):
+        """Yield results in input order, keeping a bounded window in flight"""
+        window = window or self.max_in_flight
+        pending = []
+        try:
+            for arg in iterable:
+                pending.append(asyncio.ensure_future(self.submit(fn, arg)))
+                if len(pending) >= window:
+                    yield await pending.pop(0)
+            while pending:
+                yield await pending.pop(0)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown(wait=True)
+
+# task executed in a worker process
+def square(x):
+    """Quick task used to measure per-call latency"""
+    return x * x
+
+def slow_square(x):
+    """Task that takes a varying amount of time"""
+    sleep(0.05 * (x % 4))
+    return x, x * x
+
+def long_task(seconds):
+    """Task that checks for cancellation while it works"""
+    start = perf_counter()
+    while perf_counter() - start < seconds:
+        if cancelled():
+            print(f'Worker {os.getpid()} saw cancellation', flush=True)
+            return None
+        sleep(0.01)
+    return seconds
+
+# Example 1: await submit, as_completed and imap
+async def async_api_example():
+    print('=== Async API Example ===')
+    async with AsyncProcessPool(max_workers=4, max_in_flight=8) as pool:
+        print(f'submit: {await pool.submit(square, 7)}')
+        async for arg, result in pool.as_completed(slow_square, range(6)):
+            print(f'as_completed: {arg} -> {result}')
+        results = [value async for value in pool.imap(square, range(10))]
+        print(f'imap: {results}')
+    print()
+
+# Example 2: cancellation reaches a running worker
+async def cancellation_example():
+    print('=== Cancellation Example ===')
+    async with AsyncProcessPool(max_workers=2) as pool:
+        task = asyncio.ensure_future(pool.submit(long_task, 5))
+        await asyncio.sleep(0.5)
+        start = perf_counter()
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            print(f'Cancelled in {perf_counter() - start:.2f}s')
+    print()
+
+# Example 3: latency benchmark against run_in_executor
+async def latency_benchmark(n=500):
+    print('=== Latency Benchmark ===')
+    loop = asyncio.get_running_loop()
+    async with AsyncProcessPool(max_workers=4, max_in_flight=16) as pool:
+        # warm up the workers
+        await asyncio.gather(*[pool.submit(square, i) for i in range(16)])
+        # native: await the wrapped process future directly
+        async def native(i):
+            start = perf_counter()
+            await pool.submit(square, i)
+            return perf_counter() - start
+        native_latency = await asyncio.gather(*[native(i) for i in range(n)])
+        # run_in_executor: a thread blocks on the process future
+        executor = pool._executor
+        threads = ThreadPoolExecutor(max_workers=16)
+        async def hopped(i):
+            start = perf_counter()
+            await loop.run_in_executor(threads,
+                lambda: executor.submit(square, i).result())
+            return perf_counter() - start
+        hopped_latency = await asyncio.gather(*[hopped(i) for i in range(n)])
+        threads.shutdown()
+    for name, latency in (('native', native_latency),
+                          ('run_in_executor', hopped_latency)):
+        p95 = quantiles(latency, n=20)[-1]
+        print(f'{name:>16}: mean {mean(latency) * 1000:.2f}ms '
+              f'p95 {p95 * 1000:.2f}ms')
+    print()
+
+# protect the entry point
+if __name__ == '__main__':
+    asyncio.run(async_api_example())
+    asyncio.run(cancellation_example())
+    asyncio.run(latency_benchmark())
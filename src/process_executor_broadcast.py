@@ -0,0 +1,144 @@
+# SuperFastPython.com
+# example of broadcasting a large constant to workers once, not once per task
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from multiprocessing import resource_tracker
+from threading import Lock
+from time import perf_counter
+import pickle
+import os
+
+"""
+Constant arguments are sent with every task
+executor.submit(resource_task, i, resource.resource_id) and the args list of
+lesson07_manager_semaphore.py send the same object with every task. That is
+cheap for an int, but a 200MB lookup table would be pickled, written through
+the pipe and unpickled again for every task.
+Broadcasts.register(name, value) pickles the value once into a shared memory
+block and returns a BroadcastHandle. The handle only holds the name, a version
+number and the block name, so it costs a few dozen bytes per task.
+In a worker, handle.value returns the value from a per-worker cache. The first
+task that needs a version attaches the block, unpickles it and caches it, so
+each worker loads each version at most once and no data goes through the pipe.
+Registering the same name again makes a new version. Workers replace their
+cached copy the next time a task brings them a handle for the new version.
+Superseded blocks are kept until release() or close(), in case tasks that still
+hold an older handle have not started yet.
+Create Broadcasts before the pool. It starts the resource tracker, and workers
+forked after that share it, so only the parent ever unlinks the blocks.
+"""
+
+# name -> (version, value) cached in this worker
+_cache = {}
+# how many times this worker loaded a broadcast
+_loads = 0
+
+class BroadcastHandle:
+    """Small picklable reference to one version of a broadcast value"""
+
+    def __init__(self, name, version, block):
+        self.name = name
+        self.version = version
+        self.block = block
+
+    @property
+    def value(self):
+        global _loads
+        cached = _cache.get(self.name)
+        if cached is not None and cached[0] == self.version:
+            return cached[1]
+        shm = SharedMemory(name=self.block)
+        try:
+            value = pickle.loads(shm.buf)
+        finally:
+            shm.close()
+        _cache[self.name] = (self.version, value)
+        _loads += 1
+        return value
+
+    def __repr__(self):
+        return f'BroadcastHandle({self.name!r}, version={self.version})'
+
+class Broadcasts:
+    """Registry of broadcast values, owned by the parent process"""
+
+    def __init__(self):
+        self._blocks = {}
+        self._versions = {}
+        self._lock = Lock()
+        # workers must inherit the parent's tracker, not start their own
+        resource_tracker.ensure_running()
+
+    def register(self, name, value):
+        """Publish value under name and return a handle to the new version"""
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        shm = SharedMemory(create=True, size=max(1, len(data)))
+        shm.buf[:len(data)] = data
+        with self._lock:
+            version = self._versions.get(name, 0) + 1
+            self._versions[name] = version
+            self._blocks[(name, version)] = shm
+        return BroadcastHandle(name, version, shm.name)
+
+    def release(self, handle):
+        """Free one version once no task will use it again"""
+        with self._lock:
+            shm = self._blocks.pop((handle.name, handle.version), None)
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+    def close(self):
+        with self._lock:
+            blocks = list(self._blocks.values())
+            self._blocks.clear()
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+# tasks executed in a worker process
+def lookup_task(task_id, table):
+    """Receives the table itself with every task"""
+    return table[task_id], os.getpid()
+
+def broadcast_lookup_task(task_id, handle):
+    """Receives a handle and reads the worker's cached table"""
+    return handle.value[task_id], os.getpid(), handle.version, _loads
+
+# Example: a large table per task vs broadcast once
+def broadcast_example(tasks=40):
+    print('=== Broadcast Example ===')
+    table = {i: i * i for i in range(1000000)}
+    print(f'Table pickles to {len(pickle.dumps(table)) / 1e6:.1f}MB')
+    with Broadcasts() as broadcasts, \
+            ProcessPoolExecutor(max_workers=4) as executor:
+        start = perf_counter()
+        list(executor.map(lookup_task, range(tasks), [table] * tasks))
+        print(f'Table with every task: {perf_counter() - start:.2f}s')
+        handle = broadcasts.register('squares', table)
+        print(f'Handle pickles to {len(pickle.dumps(handle))} bytes')
+        start = perf_counter()
+        results = list(executor.map(broadcast_lookup_task, range(tasks),
+                                    [handle] * tasks))
+        print(f'Broadcast handle: {perf_counter() - start:.2f}s')
+        loads = {pid: count for _, pid, _, count in results}
+        print(f'  loads per worker: {loads}')
+        # a new version replaces the cached copy
+        cubes = broadcasts.register('squares',
+                                    {i: i ** 3 for i in range(100)})
+        broadcasts.release(handle)
+        results = list(executor.map(broadcast_lookup_task, [2] * 8,
+                                    [cubes] * 8))
+        print(f'  after update: value {results[0][0]}, '
+              f'version {results[0][2]}')
+    print()
+
+# protect the entry point
+if __name__ == '__main__':
+    broadcast_example()
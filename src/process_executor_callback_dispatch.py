@@ -0,0 +1,223 @@
+# SuperFastPython.com
+# example of offloading result callbacks from the pool's result-handler thread
+from concurrent.futures import ProcessPoolExecutor
+from queue import Queue, Empty
+from threading import Thread, Lock
+from heapq import heappush, heappop
+from itertools import count
+from time import sleep, time, perf_counter
+import os
+
+"""
+Where do callbacks really run?
+Pool.apply_async(callback=...) and Future.add_done_callback(...) both run in the
+parent process, but not on the main thread. They run on the single helper thread
+that receives results from the workers (the result-handler thread for Pool, the
+executor manager thread for ProcessPoolExecutor).
+While a callback is running, that thread cannot receive any other result, so one
+slow callback delays every other future in the pool.
+The dispatcher below keeps the work done on that thread to a minimum: the done
+hook only enqueues the future, and the real callback runs later on one of our
+own callback threads.
+Batching: add_batch_callback(future, fn) registers fn to be called with a list
+of done futures. A callback thread that takes one of these off the queue waits
+up to batch_timeout for more, up to batch_size, and calls each fn once with all
+of its futures, so per-call overhead such as a database commit is paid once per
+batch. Callbacks registered with add_done_callback() are never held back for a
+batch, so they keep every callback thread busy.
+"""
+
+# sentinel placed on the queue to stop a callback thread
+_STOP = object()
+
+class CallbackDispatcher:
+    """Run future callbacks on a bounded set of callback threads"""
+
+    def __init__(self, max_workers=2, ordered=False, batch_size=1,
+                 batch_timeout=0.05, slow_threshold=0.5):
+        # ordered callbacks must run one after another
+        self.max_workers = 1 if ordered else max_workers
+        self.ordered = ordered
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.slow_threshold = slow_threshold
+        self.slow_callbacks = []
+        self.callbacks_run = 0
+        self._queue = Queue()
+        self._lock = Lock()
+        self._sequence = count()
+        # reorder buffer used when ordered=True
+        self._heap = []
+        self._next_seq = 0
+        self._threads = [Thread(target=self._worker, daemon=True,
+            name=f'CallbackThread-{i}') for i in range(self.max_workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def add_done_callback(self, future, fn):
+        """Register fn(future) to run off the result-handler thread"""
+        return self._register(future, fn, False)
+
+    def add_batch_callback(self, future, fn):
+        """Register fn(futures) to run once for a batch of done futures"""
+        return self._register(future, fn, True)
+
+    def _register(self, future, fn, batched):
+        seq = next(self._sequence)
+        # this hook is all that runs on the result-handler thread
+        future.add_done_callback(
+            lambda fut: self._enqueue(seq, (fut, fn, batched)))
+        return future
+
+    def _enqueue(self, seq, item):
+        if not self.ordered:
+            self._queue.put(item)
+            return
+        # release callbacks in the order they were registered
+        with self._lock:
+            heappush(self._heap, (seq, item))
+            while self._heap and self._heap[0][0] == self._next_seq:
+                _, ready = heappop(self._heap)
+                self._queue.put(ready)
+                self._next_seq += 1
+
+    def _next_batch(self):
+        # block for the first item, then gather batch callbacks up to the size
+        batch = [self._queue.get()]
+        deadline = perf_counter() + self.batch_timeout
+        while len(batch) < self.batch_size and batch[-1] is not _STOP \
+                and batch[-1][2]:
+            remaining = deadline - perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except Empty:
+                break
+        return batch
+
+    def _worker(self):
+        while True:
+            batch = self._next_batch()
+            stop = batch[-1] is _STOP
+            if stop:
+                batch.pop()
+            # one call per batch callback, with its futures in queue order
+            calls = []
+            batches = {}
+            for future, fn, batched in batch:
+                if not batched:
+                    calls.append((fn, future))
+                elif fn in batches:
+                    batches[fn].append(future)
+                else:
+                    batches[fn] = [future]
+                    calls.append((fn, batches[fn]))
+            for fn, arg in calls:
+                # keep the thread alive, or later callbacks are never run
+                try:
+                    self._run(fn, arg)
+                except Exception as e:
+                    print(f'Callback dispatch failed: {e!r}', flush=True)
+            if stop:
+                return
+
+    def _run(self, fn, arg):
+        # partials and callable objects have no __name__
+        name = getattr(fn, '__name__', repr(fn))
+        start = perf_counter()
+        try:
+            fn(arg)
+        except Exception as e:
+            print(f'Callback {name} raised: {e}', flush=True)
+        duration = perf_counter() - start
+        with self._lock:
+            self.callbacks_run += 1
+            if duration > self.slow_threshold:
+                self.slow_callbacks.append((name, duration))
+                print(f'Slow callback: {name} took {duration:.2f}s '
+                      f'(threshold {self.slow_threshold:.2f}s)', flush=True)
+
+    def shutdown(self, wait=True):
+        """Stop the callback threads once queued callbacks have run"""
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown(wait=True)
+
+# task executed in a worker process
+def task(task_id):
+    """Short task that returns its id and the worker pid"""
+    sleep(0.1)
+    return task_id, os.getpid()
+
+# heavy post-processing done on each result in the parent
+def heavy_callback(future):
+    """Callback that simulates slow post-processing"""
+    task_id, pid = future.result()
+    sleep(0.6 if task_id == 0 else 0.2)
+    print(f'Callback: task {task_id} from {pid}', flush=True)
+
+def collect(futures):
+    """Return the time taken for every future to be marked done"""
+    start = time()
+    for future in futures:
+        future.exception()
+    return time() - start
+
+# Example 1: callbacks run inline on the result-handler thread
+def inline_callbacks():
+    print('=== Inline callbacks ===')
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(task, i) for i in range(8)]
+        for future in futures:
+            future.add_done_callback(heavy_callback)
+        duration = collect(futures)
+    print(f'All results received in {duration:.2f}s')
+    print()
+
+# Example 2: callbacks offloaded to a bounded thread pool
+def offloaded_callbacks():
+    print('=== Offloaded callbacks ===')
+    with CallbackDispatcher(max_workers=4) as dispatcher:
+        with ProcessPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(task, i) for i in range(8)]
+            for future in futures:
+                dispatcher.add_done_callback(future, heavy_callback)
+            duration = collect(futures)
+        print(f'All results received in {duration:.2f}s')
+    print(f'Slow callbacks: {dispatcher.slow_callbacks}')
+    print()
+
+# post-processing that costs the same for one result or many
+def batch_callback(futures):
+    """Callback that handles a whole batch of results at once"""
+    sleep(0.2)
+    task_ids = [future.result()[0] for future in futures]
+    print(f'Batch callback: tasks {task_ids}', flush=True)
+
+# Example 3: offloaded, batched and in submission order
+def ordered_callbacks():
+    print('=== Ordered, batched callbacks ===')
+    with CallbackDispatcher(ordered=True, batch_size=4) as dispatcher:
+        with ProcessPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(task, i) for i in range(8)]
+            for future in futures:
+                dispatcher.add_batch_callback(future, batch_callback)
+            duration = collect(futures)
+        print(f'All results received in {duration:.2f}s')
+    print(f'Callbacks run: {dispatcher.callbacks_run}')
+    print()
+
+# protect the entry point
+if __name__ == '__main__':
+    inline_callbacks()
+    offloaded_callbacks()
+    ordered_callbacks()
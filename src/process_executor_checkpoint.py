@@ -0,0 +1,165 @@
+# SuperFastPython.com
+# example of checkpointed, resumable chunked processing
+from concurrent.futures import ProcessPoolExecutor
+from queue import Queue
+from threading import Thread
+from tempfile import mkdtemp
+from shutil import rmtree
+from time import sleep, time
+from zlib import crc32
+import pickle
+import struct
+import os
+
+"""
+Checkpoint file format
+The checkpoint is a single append-only file:
+  header: MAGIC, then the length-prefixed job id (utf-8)
+  record: chunk index (uint32), payload length (uint32), crc32 (uint32),
+          followed by the pickled chunk result
+Only completed chunks are ever appended, so a crash can at worst leave one
+partial record at the end. Loading stops at the first record that is short or
+fails its crc check, and that tail is truncated before new records are added.
+Writes happen on a dedicated writer thread in the parent. The done callback only
+puts the result on a queue, so neither the workers nor the result handling ever
+wait on the disk.
+"""
+
+MAGIC = b'CKPT1'
+RECORD = struct.Struct('<III')
+
+class CheckpointStore:
+    """Append-only store of completed chunk results"""
+
+    def __init__(self, path, job_id, fsync_every=8):
+        self.path = path
+        self.job_id = job_id
+        self.fsync_every = fsync_every
+        self.completed = self._load()
+        self._queue = Queue()
+        self._writer = Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def _load(self):
+        completed = {}
+        header = MAGIC + struct.pack('<I', len(self.job_id.encode())) \
+            + self.job_id.encode()
+        if not os.path.exists(self.path):
+            with open(self.path, 'wb') as file:
+                file.write(header)
+            return completed
+        with open(self.path, 'rb') as file:
+            data = file.read()
+        if not data.startswith(header):
+            raise ValueError(f'{self.path} is not a checkpoint for job '
+                             f'{self.job_id!r}')
+        offset = len(header)
+        while offset + RECORD.size <= len(data):
+            index, length, checksum = RECORD.unpack_from(data, offset)
+            payload = data[offset + RECORD.size:offset + RECORD.size + length]
+            if len(payload) < length or crc32(payload) != checksum:
+                break
+            completed[index] = pickle.loads(payload)
+            offset += RECORD.size + length
+        # drop a torn record left behind by a crash
+        if offset < len(data):
+            with open(self.path, 'r+b') as file:
+                file.truncate(offset)
+        return completed
+
+    def save(self, index, result):
+        """Queue a completed chunk for writing, never blocks on disk"""
+        self.completed[index] = result
+        self._queue.put((index, result))
+
+    def _write_loop(self):
+        with open(self.path, 'ab') as file:
+            written = 0
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                index, result = item
+                payload = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+                file.write(RECORD.pack(index, len(payload), crc32(payload)))
+                file.write(payload)
+                written += 1
+                # make a batch of records durable at once
+                if written % self.fsync_every == 0 or self._queue.empty():
+                    file.flush()
+                    os.fsync(file.fileno())
+
+    def close(self):
+        """Wait for queued records to reach the disk"""
+        self._queue.put(None)
+        self._writer.join()
+
+def resumable_map(executor, fn, chunks, store):
+    """Map fn over chunks, skipping chunks already in the checkpoint store"""
+    def checkpoint(index, future):
+        if future.exception() is None:
+            store.save(index, future.result())
+
+    # results loaded from disk, or futures of chunks submitted in this run
+    entries = []
+    for index, chunk in enumerate(chunks):
+        if index in store.completed:
+            entries.append((None, store.completed[index]))
+            continue
+        future = executor.submit(fn, chunk)
+        future.add_done_callback(
+            lambda done, index=index: checkpoint(index, done))
+        entries.append((future, None))
+    # callbacks may still be saving, so take results from the futures
+    return [value if future is None else future.result()
+            for future, value in entries]
+
+# task executed in a worker process
+def chunked_task(chunk):
+    """Process a chunk of data"""
+    results = []
+    for item in chunk:
+        # Simulate processing
+        sleep(0.01)
+        results.append(item * 2)
+    return results
+
+def flaky_chunked_task(chunk):
+    """Chunk task that fails near the end to simulate an interruption"""
+    if chunk[0] >= 900:
+        raise RuntimeError('worker interrupted')
+    return chunked_task(chunk)
+
+# Example: a job that fails at 90% and is resumed
+def checkpoint_example():
+    print('=== Checkpointed Chunked Processing Example ===')
+    checkpoint_dir = mkdtemp(prefix='ckpt-')
+    path = os.path.join(checkpoint_dir, 'chunks.ckpt')
+    data = list(range(1000))
+    chunk_size = 100
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+    try:
+        for task in (flaky_chunked_task, chunked_task):
+            store = CheckpointStore(path, job_id='double-1000')
+            print(f'Resuming with {len(store.completed)} of {len(chunks)} '
+                  f'chunks already done')
+            start_time = time()
+            try:
+                with ProcessPoolExecutor(max_workers=4) as executor:
+                    chunk_results = resumable_map(executor, task, chunks, store)
+            except RuntimeError as e:
+                print(f'Run failed: {e}')
+                continue
+            finally:
+                store.close()
+            all_results = [item for result in chunk_results for item in result]
+            print(f'Processed {len(all_results)} items in '
+                  f'{time() - start_time:.2f}s')
+            print(f'Checkpoint size: {os.path.getsize(path)} bytes')
+    finally:
+        rmtree(checkpoint_dir)
+    print()
+
+# protect the entry point
+if __name__ == '__main__':
+    checkpoint_example()
@@ -0,0 +1,261 @@
+# SuperFastPython.com
+# example of compressing large task arguments and results between processes
+from concurrent.futures import ProcessPoolExecutor, Future
+from threading import Lock
+from time import perf_counter, thread_time
+import pickle
+import zlib
+import bz2
+import lzma
+
+"""
+When does compression pay?
+Arguments and results are pickled and written through a pipe at full size. A
+list like chunked_task()'s results compresses well, but compressing costs CPU
+on one side and decompressing costs CPU on the other, so it only pays when the
+bytes saved take longer to move than the codec takes to run.
+CompressingExecutor wraps an executor. Any pickled payload (task arguments or a
+result) of at least `threshold` bytes is compressed with a standard library
+codec. Smaller payloads pass through as they are.
+Choosing the codec: CodecChooser keeps, for each (codec, level) candidate, the
+measured ratio and the CPU seconds per byte to compress and decompress. It
+estimates the cost of moving a payload as
+    cpu time + compressed bytes / bandwidth
+and picks the cheapest, where sending it uncompressed costs bytes / bandwidth.
+The first payloads probe each candidate in turn, and every `reprobe` payloads
+one candidate is measured again, so the choice follows the data. Set bandwidth
+to what your transport actually moves: a local pipe is fast, a network
+connection between hosts is not.
+Results are compressed in the worker with the codec the parent chose when it
+submitted the task. The worker sends its measurements back with the result.
+report() shows the bytes saved and the CPU spent. CPU time is measured with
+thread_time(), so work on other threads of the parent is not counted.
+"""
+
+# (codec, level) -> compress, and codec -> decompress
+COMPRESS = {
+    'zlib': lambda data, level: zlib.compress(data, level),
+    'bz2': lambda data, level: bz2.compress(data, level),
+    'lzma': lambda data, level: lzma.compress(data, preset=level),
+}
+DECOMPRESS = {'zlib': zlib.decompress, 'bz2': bz2.decompress,
+              'lzma': lzma.decompress}
+
+class Payload:
+    """Pickled bytes, compressed with codec, or as they are if codec is None"""
+
+    def __init__(self, codec, level, data, size):
+        self.codec = codec
+        self.level = level
+        self.data = data
+        self.size = size
+
+def dump(obj, choice, threshold):
+    """Pickle obj and compress it with choice if large enough"""
+    data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+    size = len(data)
+    if choice is None or size < threshold:
+        return Payload(None, None, data, size), None
+    codec, level = choice
+    start = thread_time()
+    compressed = COMPRESS[codec](data, level)
+    seconds = thread_time() - start
+    sample = (codec, level, size, len(compressed), seconds)
+    if len(compressed) >= size:
+        # incompressible, send it as it is
+        return Payload(None, None, data, size), sample
+    return Payload(codec, level, compressed, size), sample
+
+def load(payload):
+    """Unpickle a payload, returning the object and the seconds decompressing"""
+    if payload.codec is None:
+        return pickle.loads(payload.data), 0.0
+    start = thread_time()
+    data = DECOMPRESS[payload.codec](payload.data)
+    seconds = thread_time() - start
+    return pickle.loads(data), seconds
+
+def _run_compressed(fn, payload, choice, threshold):
+    """Run in a worker process: unpack the arguments, pack the result"""
+    (args, kwargs), decompress_seconds = load(payload)
+    result, sample = dump(fn(*args, **kwargs), choice, threshold)
+    return result, sample, decompress_seconds
+
+class CodecChooser:
+    """Pick the cheapest codec from measured ratio and CPU time"""
+
+    def __init__(self, candidates=(('zlib', 1), ('zlib', 6), ('bz2', 1),
+                 ('lzma', 0)), bandwidth=500e6, reprobe=50):
+        self.candidates = list(candidates)
+        self.bandwidth = bandwidth
+        self.reprobe = reprobe
+        self._measured = {candidate: None for candidate in self.candidates}
+        self._decompress = {}
+        self._choices = 0
+        self._lock = Lock()
+
+    def choose(self):
+        with self._lock:
+            self._choices += 1
+            unmeasured = [c for c, m in self._measured.items() if m is None]
+            if unmeasured:
+                return unmeasured[0]
+            if self._choices % self.reprobe == 0:
+                index = self._choices // self.reprobe
+                return self.candidates[index % len(self.candidates)]
+            return self._best()
+
+    def _best(self):
+        # cost per raw byte of each option
+        best, best_cost = None, 1 / self.bandwidth
+        for candidate, (ratio, seconds) in self._measured.items():
+            seconds += self._decompress.get(candidate[0], 0.0)
+            cost = seconds + ratio / self.bandwidth
+            if cost < best_cost:
+                best, best_cost = candidate, cost
+        return best
+
+    def best(self):
+        with self._lock:
+            if any(m is None for m in self._measured.values()):
+                return None
+            return self._best()
+
+    def record(self, codec, level, size, compressed, seconds):
+        with self._lock:
+            self._measured[(codec, level)] = (compressed / size, seconds / size)
+
+    def record_decompress(self, codec, size, seconds):
+        with self._lock:
+            self._decompress[codec] = seconds / size
+
+class CompressingExecutor:
+    """Executor wrapper that compresses large arguments and results"""
+
+    def __init__(self, executor, threshold=64 * 1024, chooser=None):
+        self._executor = executor
+        self.threshold = threshold
+        self.chooser = chooser or CodecChooser()
+        self._lock = Lock()
+        self._stats = {'payloads': 0, 'compressed': 0, 'bytes_raw': 0,
+                       'bytes_sent': 0, 'compress_cpu': 0.0,
+                       'decompress_cpu': 0.0}
+
+    def _account(self, payload, sample, decompress_seconds=0.0):
+        with self._lock:
+            stats = self._stats
+            stats['payloads'] += 1
+            stats['bytes_raw'] += payload.size
+            stats['bytes_sent'] += len(payload.data)
+            stats['decompress_cpu'] += decompress_seconds
+            if sample is not None:
+                stats['compress_cpu'] += sample[4]
+            if payload.codec is not None:
+                stats['compressed'] += 1
+        if sample is not None:
+            self.chooser.record(*sample)
+
+    def submit(self, fn, *args, **kwargs):
+        payload, sample = dump((args, kwargs), self.chooser.choose(),
+                               self.threshold)
+        self._account(payload, sample)
+        outer = Future()
+        # choose the codec for the result now, the worker cannot see the stats
+        inner = self._executor.submit(_run_compressed, fn, payload,
+                                      self.chooser.choose(), self.threshold)
+
+        def on_outer_done(done):
+            # cancelling the returned future cancels the task if not started
+            if done.cancelled():
+                inner.cancel()
+                # wake wait() and as_completed(), as the executor does
+                done.set_running_or_notify_cancel()
+
+        inner.add_done_callback(
+            lambda done: self._on_done(done, outer, payload))
+        outer.add_done_callback(on_outer_done)
+        return outer
+
+    def _on_done(self, inner, outer, sent):
+        if inner.cancelled():
+            outer.cancel()
+            return
+        if inner.exception() is not None:
+            if not outer.cancelled():
+                outer.set_exception(inner.exception())
+            return
+        payload, sample, worker_seconds = inner.result()
+        if sent.codec is not None:
+            self.chooser.record_decompress(sent.codec, sent.size,
+                                           worker_seconds)
+        try:
+            result, seconds = load(payload)
+        except Exception as e:
+            if not outer.cancelled():
+                outer.set_exception(e)
+            return
+        if payload.codec is not None:
+            self.chooser.record_decompress(payload.codec, payload.size, seconds)
+        self._account(payload, sample, worker_seconds + seconds)
+        if not outer.cancelled():
+            outer.set_result(result)
+
+    def map(self, fn, *iterables):
+        futures = [self.submit(fn, *args) for args in zip(*iterables)]
+        return (future.result() for future in futures)
+
+    def report(self):
+        """Bytes saved and CPU spent on compression so far"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['bytes_saved'] = stats['bytes_raw'] - stats['bytes_sent']
+        stats['codec'] = self.chooser.best()
+        return stats
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown(wait=True)
+
+# task executed in a worker process
+def double_chunk(chunk):
+    """chunked_task() without the sleep"""
+    return [item * 2 for item in chunk]
+
+def print_report(report):
+    print(f"  {report['compressed']}/{report['payloads']} payloads "
+          f"compressed, {report['bytes_raw'] / 1e6:.1f}MB -> "
+          f"{report['bytes_sent'] / 1e6:.1f}MB, saved "
+          f"{report['bytes_saved'] / 1e6:.1f}MB")
+    print(f"  CPU: compress {report['compress_cpu']:.2f}s, decompress "
+          f"{report['decompress_cpu']:.2f}s, chosen codec {report['codec']}")
+
+# Example: the same chunked job over a fast and a slow transport
+def compression_example():
+    print('=== Compression Example ===')
+    data = list(range(2000000))
+    chunks = [data[i:i + 100000] for i in range(0, len(data), 100000)]
+    start = perf_counter()
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        plain = list(executor.map(double_chunk, chunks))
+    print(f'Uncompressed: {perf_counter() - start:.2f}s')
+    # a local pipe, and a 100 Mbit/s network link between hosts
+    for name, bandwidth in [('pipe', 1e9), ('network', 12.5e6)]:
+        start = perf_counter()
+        chooser = CodecChooser(bandwidth=bandwidth)
+        with CompressingExecutor(ProcessPoolExecutor(max_workers=4),
+                                 chooser=chooser) as executor:
+            results = list(executor.map(double_chunk, chunks))
+            report = executor.report()
+        print(f'Compressed, {name} bandwidth: {perf_counter() - start:.2f}s, '
+              f'same results: {results == plain}')
+        print_report(report)
+    print()
+
+# protect the entry point
+if __name__ == '__main__':
+    compression_example()
@@ -0,0 +1,339 @@
+# SuperFastPython.com
+# example of an elastic process pool sized by cgroup quota and utilization
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import Process, Queue, SimpleQueue
+from multiprocessing.connection import wait
+from threading import Thread, Lock, Event
+from itertools import count
+from math import ceil
+from time import sleep, monotonic
+import pickle
+import os
+
+"""
+Why not os.cpu_count()?
+Pool() and ProcessPoolExecutor() default to os.cpu_count(), which is the number
+of CPUs on the host. In a container limited by a cgroup CPU quota, that is far
+more processes than the CPUs we may use, and they fight over the quota.
+effective_cpu_count() takes the smallest of:
+  the cgroup v2 quota in /sys/fs/cgroup/cpu.max ("quota period")
+  the cgroup v1 quota in cpu.cfs_quota_us / cpu.cfs_period_us
+  the CPUs this process may run on, from os.sched_getaffinity()
+ProcessPoolExecutor can't change its size, so ElasticProcessPool runs its own
+workers on a shared task queue. Every `interval` seconds a controller thread
+looks at:
+  queued: tasks submitted but not yet picked up by a worker
+  busy: fraction of worker time spent running tasks in the last interval
+It adds a worker when there is a backlog, or every worker is busy, for up_after
+intervals in a row. It retires a worker when the pool is mostly idle with no
+backlog for down_after intervals. Requiring several intervals in a row, and
+using separate thresholds for growing and shrinking, is the hysteresis that
+keeps the pool from flapping. Every decision is kept in `decisions` for
+monitoring.
+Busy time is counted per interval: a worker reports when it starts a task, so a
+task longer than the interval still counts as busy while it runs.
+Failures reach the future as with ProcessPoolExecutor. Tasks are pickled in
+submit() and results in the worker, so pickling errors are set on the
+future. If a worker dies, the pool is broken as with ProcessPoolExecutor: the
+other workers are terminated, every pending future fails with
+BrokenProcessPool, and so does submit(). Idle workers wait on the shared task
+queue holding its read lock, so a killed worker can take that lock with it and
+the pool could not safely go on.
+"""
+
+def _read(path):
+    try:
+        with open(path) as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+def effective_cpu_count():
+    """CPUs this process can really use, honouring cgroup quotas"""
+    limits = [os.cpu_count() or 1]
+    if hasattr(os, 'sched_getaffinity'):
+        limits.append(len(os.sched_getaffinity(0)))
+    # cgroup v2
+    cpu_max = _read('/sys/fs/cgroup/cpu.max')
+    if cpu_max:
+        quota, _, period = cpu_max.partition(' ')
+        if quota != 'max' and period:
+            limits.append(ceil(int(quota) / int(period)))
+    # cgroup v1
+    quota = _read('/sys/fs/cgroup/cpu/cpu.cfs_quota_us')
+    period = _read('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+    if quota and period and int(quota) > 0:
+        limits.append(ceil(int(quota) / int(period)))
+    return max(1, min(limits))
+
+def _pack(ok, value):
+    """Pickle a result, or the error if it can't be pickled"""
+    try:
+        return ok, pickle.dumps(value)
+    except Exception as e:
+        try:
+            return False, pickle.dumps(e)
+        except Exception:
+            return False, pickle.dumps(RuntimeError(repr(e)))
+
+def _worker(tasks, results):
+    """Worker process: run tasks until told to retire"""
+    pid = os.getpid()
+    while True:
+        item = tasks.get()
+        if item is None:
+            # tell the parent this is a clean retirement
+            results.put(('exit', None, pid))
+            break
+        task_id, payload = item
+        # written synchronously, so busy time covers the task while it runs
+        results.put(('start', task_id, pid))
+        try:
+            fn, args, kwargs = pickle.loads(payload)
+            outcome = _pack(True, fn(*args, **kwargs))
+        except Exception as e:
+            outcome = _pack(False, e)
+        results.put(('done', task_id, pid) + outcome)
+
+class ElasticProcessPool:
+    """Process pool that grows and shrinks with demand"""
+
+    def __init__(self, min_workers=1, max_workers=None, interval=0.5,
+                 up_after=2, down_after=4, busy_high=0.85, busy_low=0.3):
+        self.max_workers = max_workers or effective_cpu_count()
+        self.min_workers = min(min_workers, self.max_workers)
+        self.interval = interval
+        self.up_after = up_after
+        self.down_after = down_after
+        self.busy_high = busy_high
+        self.busy_low = busy_low
+        self.decisions = []
+        self._tasks = Queue()
+        self._results = SimpleQueue()
+        self._futures = {}
+        self._ids = count()
+        self._lock = Lock()
+        self._stop = Event()
+        self._broken = None
+        self._workers = []
+        self._size = 0
+        self._busy_time = 0.0
+        # pid -> (task_id, start) of the task each worker is running
+        self._running = {}
+        self._retired = set()
+        self._interval_start = monotonic()
+        self._up_streak = self._down_streak = 0
+        self._created = monotonic()
+        # start at the CPU quota, within the min and max bounds
+        start_size = max(self.min_workers,
+                         min(effective_cpu_count(), self.max_workers))
+        for _ in range(start_size):
+            self._add_worker()
+        self._record('start', 0, self._size, 0.0, 0)
+        self._collector = Thread(target=self._collect, daemon=True)
+        self._collector.start()
+        self._controller = Thread(target=self._control, daemon=True)
+        self._controller.start()
+
+    def _add_worker(self):
+        process = Process(target=_worker, args=(self._tasks, self._results),
+                          daemon=True)
+        process.start()
+        with self._lock:
+            self._workers.append(process)
+            self._size += 1
+
+    def _retire_worker(self):
+        # the first idle worker to read the sentinel exits
+        self._tasks.put(None)
+        with self._lock:
+            self._size -= 1
+
+    def _record(self, action, old, new, busy, queued):
+        self.decisions.append({'time': round(monotonic() - self._created, 2),
+            'action': action, 'from': old, 'to': new, 'busy': round(busy, 2),
+            'queued': queued})
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        # pickle here, so errors reach the future and not the feeder thread
+        try:
+            payload = pickle.dumps((fn, args, kwargs))
+        except Exception as e:
+            future.set_exception(e)
+            return future
+        task_id = next(self._ids)
+        with self._lock:
+            if self._broken is not None:
+                raise BrokenProcessPool(self._broken)
+            self._futures[task_id] = future
+        self._tasks.put((task_id, payload))
+        return future
+
+    def map(self, fn, *iterables):
+        futures = [self.submit(fn, *args) for args in zip(*iterables)]
+        return (future.result() for future in futures)
+
+    def _collect(self):
+        reader = self._results._reader
+        while True:
+            with self._lock:
+                workers = {p.sentinel: p for p in self._workers}
+            ready = wait([reader, *workers], timeout=self.interval)
+            if reader in ready:
+                item = self._results.get()
+                if item is None:
+                    break
+                self._handle(item)
+                continue
+            # only once the pipe is drained, so a dead worker's last
+            # messages have been handled
+            for sentinel in ready:
+                self._worker_exited(workers[sentinel])
+
+    def _handle(self, item):
+        kind, task_id, pid = item[:3]
+        with self._lock:
+            if kind == 'exit':
+                self._retired.add(pid)
+                return
+            if kind == 'start':
+                self._running[pid] = (task_id, monotonic())
+                return
+            held = self._running.pop(pid, None)
+            if held is not None:
+                # only the part of the task inside this interval
+                self._busy_time += monotonic() - max(held[1],
+                                                     self._interval_start)
+            future = self._futures.pop(task_id, None)
+        if future is None:
+            return
+        ok, data = item[3:]
+        try:
+            value = pickle.loads(data)
+        except Exception as e:
+            ok, value = False, e
+        if ok:
+            future.set_result(value)
+        else:
+            future.set_exception(value)
+
+    def _worker_exited(self, process):
+        """Break the pool if a worker died, rather than retired"""
+        process.join()
+        with self._lock:
+            self._workers.remove(process)
+            if process.pid in self._retired:
+                self._retired.discard(process.pid)
+                return
+            if self._broken is not None or self._stop.is_set():
+                return
+            self._record('died', self._size, self._size - 1, 0.0, 0)
+        self._break(f'worker {process.pid} died with exit code '
+                    f'{process.exitcode}')
+
+    def _break(self, reason):
+        """Fail every pending future, as ProcessPoolExecutor does"""
+        # results the workers sent before the pool broke
+        while self._results._reader.poll():
+            item = self._results.get()
+            if item is None:
+                # shutdown is waiting for the collector to see this
+                self._results.put(None)
+                break
+            self._handle(item)
+        with self._lock:
+            self._broken = reason
+            self._size = 0
+            futures = list(self._futures.values())
+            self._futures.clear()
+            self._running.clear()
+            workers = list(self._workers)
+        # a dead worker may hold the task queue's lock, so the others
+        # can't be told to stop
+        for process in workers:
+            process.terminate()
+        for future in futures:
+            future.set_exception(BrokenProcessPool(reason))
+
+    def _control(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                if self._broken is not None:
+                    break
+                now = monotonic()
+                # finished work plus the running part of unfinished tasks
+                busy_time = self._busy_time + sum(
+                    now - max(start, self._interval_start)
+                    for _, start in self._running.values())
+                busy = min(1.0, busy_time / (max(1, self._size)
+                                             * (now - self._interval_start)))
+                self._busy_time = 0.0
+                self._interval_start = now
+                in_flight = len(self._futures)
+                size = self._size
+            queued = max(0, in_flight - size)
+            grow = queued > 0 or busy >= self.busy_high
+            shrink = queued == 0 and busy <= self.busy_low
+            self._up_streak = self._up_streak + 1 if grow else 0
+            self._down_streak = self._down_streak + 1 if shrink else 0
+            old = self._size
+            if self._up_streak >= self.up_after and old < self.max_workers:
+                self._add_worker()
+                self._up_streak = 0
+                self._record('grow', old, self._size, busy, queued)
+            elif self._down_streak >= self.down_after and old > self.min_workers:
+                self._retire_worker()
+                self._down_streak = 0
+                self._record('shrink', old, self._size, busy, queued)
+
+    def shutdown(self):
+        self._stop.set()
+        self._controller.join()
+        with self._lock:
+            workers = list(self._workers)
+        if self._broken is not None:
+            for process in workers:
+                process.terminate()
+            self._tasks.cancel_join_thread()
+        else:
+            for _ in range(self._size):
+                self._tasks.put(None)
+        for process in workers:
+            process.join()
+        self._results.put(None)
+        self._collector.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+# task executed in a worker process
+def work_task(duration):
+    """Task that keeps a worker busy for a while"""
+    sleep(duration)
+    return os.getpid()
+
+# Example: a burst of work, then a quiet period
+def elastic_example():
+    print('=== Elastic Pool Example ===')
+    print(f'os.cpu_count(): {os.cpu_count()}, '
+          f'effective CPUs: {effective_cpu_count()}')
+    with ElasticProcessPool(min_workers=1, max_workers=4, interval=0.25,
+                            down_after=2) as pool:
+        # quiet period: the pool shrinks towards min_workers
+        sleep(2)
+        # burst: the backlog grows the pool again
+        pids = set(pool.map(work_task, [0.1] * 60))
+        print(f'Burst ran on {len(pids)} worker processes')
+        sleep(1)
+    for decision in pool.decisions:
+        print(f'  {decision}')
+    print()
+
+# protect the entry point
+if __name__ == '__main__':
+    elastic_example()
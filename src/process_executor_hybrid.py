@@ -0,0 +1,172 @@
+# SuperFastPython.com
+# example of routing tasks to threads or processes by their measured profile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future
+from threading import Lock
+from time import perf_counter, process_time
+from process_executor_examples import map_task, cpu_bound_task
+
+"""
+Threads or processes?
+A task that mostly waits (sleep, network, disk) barely uses the CPU, so a thread
+runs it just as well as a process. Threads are much cheaper to start, and their
+arguments and results are never pickled. A task that keeps the CPU busy needs a
+process to get around the GIL.
+HybridExecutor learns which kind each function is. The first probe_calls calls
+of a function run in the process pool, where each worker runs one task at a
+time, so process_time() in the worker measures just that task's CPU time. Once
+the samples are in, the function's CPU/wall ratio decides its route. On Linux,
+time spent runnable but waiting for a CPU (from /proc/thread-self/schedstat) is
+taken off the wall time, so a CPU-bound task on a busy host is not mistaken for
+one that waits on I/O:
+  below cpu_threshold: I/O-shaped, run in the thread pool
+  at or above: CPU-shaped, run in the process pool
+Decisions are made per function (module and qualified name) and are reported by
+routing_report(). A probe that raises or is cancelled gives no sample, so a
+later call of the function is probed in its place.
+"""
+
+def _runqueue_wait():
+    """Seconds this thread has spent waiting for a CPU, 0.0 if unknown"""
+    try:
+        with open('/proc/thread-self/schedstat') as file:
+            return int(file.read().split()[1]) / 1e9
+    except (OSError, IndexError, ValueError):
+        return 0.0
+
+def _measure(fn, args, kwargs):
+    """Run in a worker process: return the result with CPU and wall time"""
+    wall, cpu, waited = perf_counter(), process_time(), _runqueue_wait()
+    result = fn(*args, **kwargs)
+    wall = perf_counter() - wall - (_runqueue_wait() - waited)
+    return result, process_time() - cpu, wall
+
+class HybridExecutor:
+    """One submit/map API over a thread pool and a process pool"""
+
+    def __init__(self, max_processes=None, max_threads=32, probe_calls=3,
+                 cpu_threshold=0.5):
+        self._processes = ProcessPoolExecutor(max_workers=max_processes)
+        self._threads = ThreadPoolExecutor(max_workers=max_threads)
+        self.probe_calls = probe_calls
+        self.cpu_threshold = cpu_threshold
+        self._profiles = {}
+        self._lock = Lock()
+
+    def _profile(self, fn):
+        key = f'{fn.__module__}.{fn.__qualname__}'
+        with self._lock:
+            return self._profiles.setdefault(key, {'route': None,
+                'probes': 0, 'samples': 0, 'cpu': 0.0, 'wall': 0.0,
+                'ratio': 0.0, 'calls': 0})
+
+    def submit(self, fn, *args, **kwargs):
+        profile = self._profile(fn)
+        with self._lock:
+            profile['calls'] += 1
+            route = profile['route']
+            probing = route is None and profile['probes'] < self.probe_calls
+            if probing:
+                profile['probes'] += 1
+        if route == 'thread':
+            return self._threads.submit(fn, *args, **kwargs)
+        if not probing:
+            # decided CPU-shaped, or probes still in flight
+            return self._processes.submit(fn, *args, **kwargs)
+        outer = Future()
+        try:
+            inner = self._processes.submit(_measure, fn, args, kwargs)
+        except Exception:
+            self._probe_failed(profile)
+            raise
+
+        def on_outer_done(done):
+            # cancelling the returned future cancels the probe if not started
+            if done.cancelled():
+                inner.cancel()
+                # wake wait() and as_completed(), as the executor does
+                done.set_running_or_notify_cancel()
+
+        inner.add_done_callback(
+            lambda done: self._on_probe(done, outer, profile))
+        outer.add_done_callback(on_outer_done)
+        return outer
+
+    def _probe_failed(self, profile):
+        # no sample, so let a later call probe again
+        with self._lock:
+            profile['probes'] -= 1
+
+    def _on_probe(self, inner, outer, profile):
+        if inner.cancelled():
+            self._probe_failed(profile)
+            outer.cancel()
+            return
+        if inner.exception() is not None:
+            self._probe_failed(profile)
+            if not outer.cancelled():
+                outer.set_exception(inner.exception())
+            return
+        result, cpu, wall = inner.result()
+        with self._lock:
+            profile['cpu'] += cpu
+            profile['wall'] += wall
+            profile['samples'] += 1
+            if (profile['route'] is None
+                    and profile['samples'] >= self.probe_calls):
+                ratio = profile['cpu'] / max(profile['wall'], 1e-9)
+                profile['ratio'] = ratio
+                profile['route'] = ('process' if ratio >= self.cpu_threshold
+                                    else 'thread')
+        if not outer.cancelled():
+            outer.set_result(result)
+
+    def map(self, fn, *iterables):
+        futures = [self.submit(fn, *args) for args in zip(*iterables)]
+        return (future.result() for future in futures)
+
+    def routing_report(self):
+        """Routing decision for each function seen so far"""
+        with self._lock:
+            return {key: {'route': profile['route'],
+                          'cpu_ratio': round(profile['ratio'], 2),
+                          'calls': profile['calls']}
+                    for key, profile in self._profiles.items()}
+
+    def shutdown(self, wait=True):
+        self._threads.shutdown(wait=wait)
+        self._processes.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown(wait=True)
+
+# Example: I/O-shaped and CPU-shaped work through one executor
+def hybrid_example():
+    print('=== Hybrid Executor Example ===')
+    io_data = list(range(64))
+    cpu_data = [300000] * 8
+    # all work in a process pool
+    start = perf_counter()
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        list(executor.map(map_task, io_data))
+        list(executor.map(cpu_bound_task, cpu_data))
+    print(f'Process pool only: {perf_counter() - start:.2f}s')
+    # routed by measured profile
+    start = perf_counter()
+    with HybridExecutor(max_processes=4) as executor:
+        # a few calls each to learn the profiles
+        list(executor.map(map_task, io_data[:4]))
+        list(executor.map(cpu_bound_task, cpu_data[:4]))
+        list(executor.map(map_task, io_data[4:]))
+        list(executor.map(cpu_bound_task, cpu_data[4:]))
+        report = executor.routing_report()
+    print(f'Hybrid executor: {perf_counter() - start:.2f}s')
+    for name, decision in report.items():
+        print(f'  {name}: {decision}')
+    print()
+
+# protect the entry point
+if __name__ == '__main__':
+    hybrid_example()
@@ -0,0 +1,181 @@
+# SuperFastPython.com
+# example of content-addressed memoization of process pool tasks
+from concurrent.futures import ProcessPoolExecutor, Future, CancelledError
+from collections import OrderedDict
+from threading import Lock
+from hashlib import sha256
+from time import time
+from tempfile import mkdtemp
+from shutil import rmtree
+import pickle
+import os
+from process_executor_examples import cpu_bound_task
+
+"""
+How the cache works
+Each call is keyed on a hash of the function's identity (module and qualified
+name) and its pickled arguments, so the same call always gets the same key.
+The parent keeps a small in-memory LRU of recent results. Behind it is an
+on-disk store with one file per key, shared by every worker and every run.
+Workers look up and write the disk store themselves. Each file is written to a
+temporary name and moved into place with os.replace(), which is atomic, so
+readers never see a partly written entry even when several processes write at
+once.
+When the store grows past max_disk_bytes, the least recently used files
+(oldest modification time, refreshed on every hit) are deleted.
+Identical calls that are already running are coalesced: they share one task
+instead of running twice. Each caller still gets its own future, already marked
+running, so one caller can't cancel another's result.
+Only memoize deterministic functions whose arguments pickle the same way every
+time.
+"""
+
+def cache_key(fn, args, kwargs):
+    """Hash the function identity and its pickled arguments"""
+    payload = pickle.dumps((fn.__module__, fn.__qualname__, args,
+        sorted(kwargs.items())), protocol=pickle.HIGHEST_PROTOCOL)
+    return sha256(payload).hexdigest()
+
+def _disk_get(cache_dir, key):
+    path = os.path.join(cache_dir, key)
+    try:
+        with open(path, 'rb') as file:
+            value = pickle.load(file)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        return False, None
+    # refresh the entry's place in the LRU order
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+    return True, value
+
+def _disk_put(cache_dir, key, value, max_disk_bytes):
+    path = os.path.join(cache_dir, key)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as file:
+        pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)
+    _disk_evict(cache_dir, max_disk_bytes)
+
+def _disk_evict(cache_dir, max_disk_bytes):
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith('.tmp'):
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_disk_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+def _cached_call(cache_dir, max_disk_bytes, key, fn, args, kwargs):
+    """Run in the worker: return (hit, value) using the shared disk store"""
+    hit, value = _disk_get(cache_dir, key)
+    if hit:
+        return True, value
+    value = fn(*args, **kwargs)
+    _disk_put(cache_dir, key, value, max_disk_bytes)
+    return False, value
+
+class MemoizingExecutor:
+    """Wrap a ProcessPoolExecutor with a memory and disk result cache"""
+
+    def __init__(self, executor, cache_dir, memory_items=128,
+                 max_disk_bytes=64 * 1024 * 1024):
+        self._executor = executor
+        self.cache_dir = cache_dir
+        self.memory_items = memory_items
+        self.max_disk_bytes = max_disk_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self._memory = OrderedDict()
+        self._in_flight = {}
+        self._lock = Lock()
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'coalesced': 0,
+                      'computed': 0}
+
+    def submit(self, fn, *args, **kwargs):
+        """Return a future for fn(*args, **kwargs), reusing cached results"""
+        key = cache_key(fn, args, kwargs)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                future = Future()
+                future.set_result(self._memory[key])
+                return future
+            # each caller gets its own future, running like any dispatched task
+            future = Future()
+            future.set_running_or_notify_cancel()
+            if key in self._in_flight:
+                self.stats['coalesced'] += 1
+                self._in_flight[key].append(future)
+                return future
+            self._in_flight[key] = [future]
+        try:
+            inner = self._executor.submit(_cached_call, self.cache_dir,
+                self.max_disk_bytes, key, fn, args, kwargs)
+        except Exception as e:
+            # don't leave the key in flight, or later calls would wait forever
+            with self._lock:
+                waiters = self._in_flight.pop(key)
+            for waiter in waiters:
+                waiter.set_exception(e)
+            return future
+        inner.add_done_callback(lambda done: self._on_done(key, done))
+        return future
+
+    def _on_done(self, key, inner):
+        # the waiters are running, so a cancelled task becomes an error
+        error = CancelledError() if inner.cancelled() else inner.exception()
+        with self._lock:
+            waiters = self._in_flight.pop(key)
+            if error is None:
+                hit, value = inner.result()
+                self.stats['disk_hits' if hit else 'computed'] += 1
+                self._memory[key] = value
+                if len(self._memory) > self.memory_items:
+                    self._memory.popitem(last=False)
+        for future in waiters:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(value)
+
+    def map(self, fn, *iterables):
+        """Memoized equivalent of Executor.map()"""
+        futures = [self.submit(fn, *args) for args in zip(*iterables)]
+        return (future.result() for future in futures)
+
+# Example: repeated runs of performance_comparison() style inputs
+def memoize_example():
+    print('=== Memoization Example ===')
+    cache_dir = mkdtemp(prefix='memo-')
+    test_data = [1000000] * 4
+    try:
+        for run in range(2):
+            with ProcessPoolExecutor(max_workers=4) as executor:
+                memo = MemoizingExecutor(executor, cache_dir)
+                start = time()
+                results = list(memo.map(cpu_bound_task, test_data))
+                duration = time() - start
+                # a second pass in the same run is served from memory
+                list(memo.map(cpu_bound_task, test_data))
+            print(f'Run {run}: {duration:.2f}s, stats {memo.stats}')
+        print(f'Results: {results[:2]}...')
+    finally:
+        rmtree(cache_dir)
+    print()
+
+# protect the entry point
+if __name__ == '__main__':
+    memoize_example()
@@ -0,0 +1,177 @@
+# SuperFastPython.com
+# example of parallel file processing with mmap and byte-range splitting
+from concurrent.futures import ProcessPoolExecutor
+from tempfile import mkdtemp
+from shutil import rmtree
+from random import random, randint
+from time import perf_counter
+import mmap
+import struct
+import os
+
+"""
+Why split by byte range?
+Reading a file in the parent and sending slices of it to workers means every byte
+is read once, pickled, pushed through a pipe and unpickled again.
+Here the parent only works out where each worker should start and stop. Each
+worker opens the file itself and maps just its own byte range with mmap, so the
+data goes straight from the page cache into the worker.
+Ranges must start and end on record boundaries:
+  newline: move each split point forward to just after the next b'\n'
+  length: records are a 4-byte little-endian length followed by the payload,
+          so the parent walks the headers (seeking past each payload) to find
+          the record that starts at or after each split point
+"""
+
+LENGTH = struct.Struct('<I')
+
+def split_ranges(path, parts, record_format='newline'):
+    """Return (start, end) byte ranges aligned to record boundaries"""
+    size = os.path.getsize(path)
+    targets = [size * i // parts for i in range(1, parts)]
+    bounds = [0]
+    with open(path, 'rb') as file:
+        if record_format == 'newline':
+            for target in targets:
+                file.seek(max(target, bounds[-1]))
+                file.readline()
+                bounds.append(min(file.tell(), size))
+        elif record_format == 'length':
+            offset = 0
+            for target in targets:
+                while offset < min(target, size):
+                    file.seek(offset)
+                    (length,) = LENGTH.unpack(file.read(LENGTH.size))
+                    offset += LENGTH.size + length
+                bounds.append(min(offset, size))
+        else:
+            raise ValueError(f'unknown record format {record_format!r}')
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:])
+            if end > start]
+
+def iter_records(view, record_format):
+    """Yield each record in a mapped byte range as bytes"""
+    data, start, end = view.obj, view.start, view.end
+    if record_format == 'newline':
+        while start < end:
+            stop = data.find(b'\n', start, end)
+            stop = end if stop == -1 else stop + 1
+            yield data[start:stop]
+            start = stop
+    else:
+        while start < end:
+            (length,) = LENGTH.unpack_from(data, start)
+            start += LENGTH.size
+            yield data[start:start + length]
+            start += length
+
+class MappedRange:
+    """A worker's mmap of one byte range of a file"""
+
+    def __init__(self, path, start, end):
+        # mmap offsets must be a multiple of the allocation granularity
+        self.start = start % mmap.ALLOCATIONGRANULARITY
+        self.end = self.start + end - start
+        base = start - self.start
+        with open(path, 'rb') as file:
+            self.obj = mmap.mmap(file.fileno(), end - base, offset=base,
+                                 access=mmap.ACCESS_READ)
+
+    def close(self):
+        self.obj.close()
+
+def _process_range(path, start, end, fn, record_format):
+    """Run in the worker: map the range and apply fn to its records"""
+    view = MappedRange(path, start, end)
+    try:
+        return fn(iter_records(view, record_format))
+    finally:
+        view.close()
+
+def file_map(executor, fn, path, parts=None, record_format='newline'):
+    """Apply fn(records) to each record-aligned range, in file order"""
+    parts = parts or executor._max_workers
+    ranges = split_ranges(path, parts, record_format)
+    futures = [executor.submit(_process_range, path, start, end, fn,
+        record_format) for start, end in ranges]
+    return [future.result() for future in futures]
+
+# task executed in a worker process
+def count_errors(records):
+    """Count records and records that contain ERROR"""
+    total = errors = 0
+    for record in records:
+        total += 1
+        if b'ERROR' in record:
+            errors += 1
+    return total, errors
+
+def count_errors_in_lines(lines):
+    """Same count for lines that were read and pickled by the parent"""
+    return count_errors(line.encode() for line in lines)
+
+def write_log(path, lines):
+    with open(path, 'w') as file:
+        for i in range(lines):
+            level = 'ERROR' if random() < 0.05 else 'INFO'
+            file.write(f'{i} {level} request took {randint(1, 999)}ms '
+                       f'{"x" * randint(20, 120)}\n')
+
+def write_length_prefixed(path, records):
+    with open(path, 'wb') as file:
+        for i in range(records):
+            payload = (b'ERROR ' if i % 10 == 0 else b'INFO ') * randint(1, 20)
+            file.write(LENGTH.pack(len(payload)) + payload)
+
+# Example 1: mmap byte ranges vs reading and pickling in the parent
+def mmap_example():
+    print('=== mmap File Processing Example ===')
+    work_dir = mkdtemp(prefix='mmap-')
+    path = os.path.join(work_dir, 'app.log')
+    try:
+        write_log(path, 500000)
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        with ProcessPoolExecutor(max_workers=4) as executor:
+            start = perf_counter()
+            partials = file_map(executor, count_errors, path)
+            duration = perf_counter() - start
+            print(f'mmap ranges: {[sum(p) for p in zip(*partials)]} '
+                  f'{size_mb / duration:.1f} MB/s')
+            # baseline: the parent reads everything and ships slices
+            start = perf_counter()
+            with open(path) as file:
+                lines = file.readlines()
+            step = len(lines) // 4 + 1
+            partials = list(executor.map(count_errors_in_lines,
+                [lines[i:i + step] for i in range(0, len(lines), step)]))
+            duration = perf_counter() - start
+            print(f'read+pickle: {[sum(p) for p in zip(*partials)]} '
+                  f'{size_mb / duration:.1f} MB/s')
+    finally:
+        rmtree(work_dir)
+    print()
+
+# Example 2: length-prefixed records
+def length_prefixed_example():
+    print('=== Length-Prefixed Records Example ===')
+    work_dir = mkdtemp(prefix='mmap-')
+    path = os.path.join(work_dir, 'records.bin')
+    try:
+        write_length_prefixed(path, 100000)
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        with ProcessPoolExecutor(max_workers=4) as executor:
+            start = perf_counter()
+            partials = file_map(executor, count_errors, path,
+                record_format='length')
+            duration = perf_counter() - start
+        print(f'records, errors: {[sum(p) for p in zip(*partials)]} '
+              f'{size_mb / duration:.1f} MB/s')
+    finally:
+        rmtree(work_dir)
+    print()
+
+# protect the entry point
+if __name__ == '__main__':
+    mmap_example()
+    length_prefixed_example()
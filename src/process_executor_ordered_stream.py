@@ -0,0 +1,82 @@
+# SuperFastPython.com
+# example of ordered streaming results with a bounded reorder window
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
+from time import sleep, perf_counter
+
+"""
+Why not executor.map()?
+executor.map() submits every item up front and yields results in input order.
+If an early item is slow, every later result that is already done sits in memory
+until the slow item finishes, and nothing stops more and more of them piling up.
+OrderedStream keeps at most `window` tasks between dispatch and consumption. New
+work is only dispatched when the result at the head of the window is yielded, so
+memory is bounded by the window size, not the input size.
+Head-of-line blocking is the time spent waiting for the head result while at
+least one later result in the window was already done.
+"""
+
+class OrderedStream:
+    """Yield fn(item) in input order with a bounded reorder window"""
+
+    def __init__(self, executor, fn, iterable, window=8):
+        self._executor = executor
+        self._fn = fn
+        self._items = iter(iterable)
+        self.window = window
+        self.stats = {'yielded': 0, 'max_buffered_done': 0,
+                      'hol_blocked_time': 0.0, 'hol_blocked_count': 0}
+
+    def _fill(self, pending):
+        # dispatch new work only while there is room in the window
+        for item in self._items:
+            pending.append(self._executor.submit(self._fn, item))
+            if len(pending) >= self.window:
+                break
+
+    def __iter__(self):
+        pending = deque()
+        self._fill(pending)
+        while pending:
+            head = pending[0]
+            if not head.done():
+                # wait until either the head or a later result is done
+                wait(pending, return_when=FIRST_COMPLETED)
+                if not head.done():
+                    # a later result is ready but must wait for the head
+                    start = perf_counter()
+                    wait([head])
+                    self.stats['hol_blocked_time'] += perf_counter() - start
+                    self.stats['hol_blocked_count'] += 1
+                    buffered = sum(f.done() for f in pending) - 1
+                    self.stats['max_buffered_done'] = max(
+                        self.stats['max_buffered_done'], buffered)
+            pending.popleft()
+            self.stats['yielded'] += 1
+            self._fill(pending)
+            yield head.result()
+
+# task executed in a worker process
+def uneven_task(x):
+    """Every tenth item is much slower than the rest"""
+    sleep(0.5 if x % 10 == 0 else 0.02)
+    return x * x
+
+# Example: ordered output for a writer with bounded memory
+def ordered_stream_example():
+    print('=== Ordered Streaming Example ===')
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        start = perf_counter()
+        stream = OrderedStream(executor, uneven_task, range(40), window=8)
+        results = list(stream)
+        print(f'Got {len(results)} results in order in '
+              f'{perf_counter() - start:.2f}s: {results[:8]}...')
+        stats = stream.stats
+        print(f'Head-of-line blocked {stats["hol_blocked_count"]} times '
+              f'for {stats["hol_blocked_time"]:.2f}s, at most '
+              f'{stats["max_buffered_done"]} finished results buffered')
+    print()
+
+# protect the entry point
+if __name__ == '__main__':
+    ordered_stream_example()
@@ -0,0 +1,170 @@
+# SuperFastPython.com
+# example of preloading imports and data once for all pool workers
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, get_all_start_methods
+from queue import Empty
+from time import perf_counter, time
+import importlib
+import sys
+import os
+
+"""
+Why do spawn workers start slowly?
+A 'spawn' worker is a fresh interpreter. Before it can run its first task it
+re-imports the __main__ module and everything that module imports, and it
+rebuilds any module-level data. Every new worker pays that again, including
+workers replaced by max_tasks_per_child.
+A PreloadManifest lists the modules to import and the data to have ready:
+  modules: module names, e.g. ['json', 'decimal']
+  data: name -> 'module:attribute', for values built when the module is imported
+PreloadedExecutor imports them once in a template process and starts the
+workers from it:
+  'forkserver': set_forkserver_preload() imports the manifest in the fork
+      server, and every worker is forked from the server with it all loaded
+  'fork': the parent is the template and imports the manifest before the pool
+      starts
+  'spawn': no template. Every worker imports the manifest itself (the baseline)
+There is one fork server per parent process, and set_forkserver_preload() only
+takes effect when it first starts, so every 'forkserver' executor shares the
+first manifest's modules. A later manifest that needs other modules raises
+RuntimeError rather than silently running without them. Use 'fork' or 'spawn',
+or one manifest listing every module, in that case.
+Keep the __main__ script light and put heavy imports and data in modules on the
+manifest. Spawn and forkserver workers still re-import __main__, and on Python
+3.11 set_forkserver_preload(['__main__']) is ignored because the fork server is
+not given the main script's path.
+Each worker's initializer imports the manifest again, timing each module, and
+puts a startup record on a queue. Modules inherited from the template cost
+almost nothing here. Modules a spawn worker has to load show their real cost.
+startup_report() collects the records:
+  startup: seconds from the worker process starting to being ready for its
+      first task (read from /proc on Linux, None elsewhere)
+  imports: seconds per manifest module imported in the initializer
+  ready_after: seconds from pool creation to the worker being ready
+"""
+
+class PreloadManifest:
+    """Modules and module-level data to load once for all workers"""
+
+    def __init__(self, modules=(), data=None):
+        self.data = dict(data or {})
+        self.modules = list(modules)
+        # modules that hold data are preloaded too
+        for ref in self.data.values():
+            module = ref.partition(':')[0]
+            if module not in self.modules:
+                self.modules.append(module)
+
+def _resolve(ref):
+    module, _, attribute = ref.partition(':')
+    return getattr(importlib.import_module(module), attribute)
+
+# data of the manifest, available in each worker
+_preloaded = {}
+# modules given to the fork server, which only reads them when it starts
+_forkserver_modules = None
+
+def preloaded(name):
+    """Data loaded by the manifest, called in a worker"""
+    return _preloaded[name]
+
+def _import_timed(module):
+    start = perf_counter()
+    importlib.import_module(module)
+    return perf_counter() - start
+
+def _process_age():
+    """Seconds since this process started, None if unknown"""
+    try:
+        with open('/proc/self/stat') as file:
+            # skip past the command name, which may contain spaces
+            fields = file.read().rpartition(')')[2].split()
+        with open('/proc/uptime') as file:
+            uptime = float(file.read().split()[0])
+    except (OSError, IndexError, ValueError):
+        return None
+    return uptime - int(fields[19]) / os.sysconf('SC_CLK_TCK')
+
+def _record_startup(manifest, created, records):
+    """Pool initializer: load the manifest, timing each import"""
+    imports = {module: _import_timed(module) for module in manifest.modules}
+    for name, ref in manifest.data.items():
+        _preloaded[name] = _resolve(ref)
+    records.put({'pid': os.getpid(), 'startup': _process_age(),
+                 'imports': imports, 'modules_loaded': len(sys.modules),
+                 'ready_after': time() - created})
+
+def _set_forkserver_preload(context, modules):
+    global _forkserver_modules
+    if _forkserver_modules is None:
+        # only used when the server starts, so set it before the first pool
+        context.set_forkserver_preload(modules)
+        _forkserver_modules = list(modules)
+        return
+    missing = [m for m in modules if m not in _forkserver_modules]
+    if missing:
+        raise RuntimeError(f'the fork server was set up to preload '
+                           f'{_forkserver_modules}, it cannot also preload '
+                           f'{missing}')
+
+class PreloadedExecutor(ProcessPoolExecutor):
+    """ProcessPoolExecutor that records per-worker startup"""
+
+    def __init__(self, manifest, max_workers=None, method='forkserver',
+                 **kwargs):
+        if method not in get_all_start_methods():
+            raise ValueError(f'start method {method!r} is not available')
+        context = get_context(method)
+        if method == 'forkserver':
+            _set_forkserver_preload(context, manifest.modules)
+        elif method == 'fork':
+            for module in manifest.modules:
+                importlib.import_module(module)
+        self.method = method
+        self._records = context.Queue()
+        self._startup = []
+        super().__init__(max_workers=max_workers, mp_context=context,
+            initializer=_record_startup,
+            initargs=(manifest, time(), self._records), **kwargs)
+
+    def startup_report(self):
+        """Startup records of the workers that have started so far"""
+        try:
+            while True:
+                self._startup.append(self._records.get(timeout=0.1))
+        except Empty:
+            pass
+        return list(self._startup)
+
+# task executed in a worker process
+def entity_task(name):
+    return preloaded('entities')[name]
+
+# Example: time to first task with and without a template process
+def preload_example():
+    print('=== Preload Example ===')
+    manifest = PreloadManifest(
+        modules=['json', 'decimal', 'asyncio', 'xml.etree.ElementTree'],
+        data={'entities': 'html.entities:html5'})
+    for method in ['spawn', 'forkserver']:
+        start = perf_counter()
+        with PreloadedExecutor(manifest, 4, method) as executor:
+            names = ['amp;', 'lt;', 'gt;', 'copy;'] * 2
+            results = list(executor.map(entity_task, names))
+            elapsed = perf_counter() - start
+        report = executor.startup_report()
+        print(f'{method}: first 8 tasks after {elapsed:.2f}s, '
+              f'{len(report)} workers started, results {results[:4]}')
+        for record in sorted(report, key=lambda r: r['ready_after']):
+            slowest = max(record['imports'], key=record['imports'].get)
+            startup = record['startup']
+            startup = 'unknown' if startup is None else f'{startup:.2f}s'
+            print(f"  worker {record['pid']}: startup {startup}, ready "
+                  f"{record['ready_after']:.2f}s after pool creation, "
+                  f"slowest import {slowest} "
+                  f"{record['imports'][slowest] * 1000:.1f}ms")
+    print()
+
+# protect the entry point
+if __name__ == '__main__':
+    preload_example()
@@ -0,0 +1,171 @@
+# SuperFastPython.com
+# example of priority-aware task scheduling with a process pool
+from concurrent.futures import ProcessPoolExecutor, Future
+from collections import deque
+from threading import Condition
+from time import sleep, perf_counter
+import os
+
+"""
+Why not just submit() to ProcessPoolExecutor?
+ProcessPoolExecutor puts every submitted task into a FIFO work queue, and its
+manager thread moves tasks onto the call queue as soon as there is room. Once a
+task is submitted its position is fixed, so an interactive request waits behind
+every batch job submitted before it.
+PriorityProcessPoolExecutor keeps tasks in the parent, in one FIFO per priority
+level, and only hands a task to the pool when a worker is free. The choice is
+made at dispatch time, so priority applies to every task that has not yet been
+dispatched.
+Aging: each task gains one level of priority for every aging_interval seconds it
+waits, so low priority work cannot be starved forever.
+"""
+
+class PriorityProcessPoolExecutor:
+    """Process pool that dispatches queued tasks by priority with aging"""
+
+    def __init__(self, max_workers=None, levels=3, aging_interval=1.0):
+        self._executor = ProcessPoolExecutor(max_workers=max_workers)
+        self.max_workers = self._executor._max_workers
+        self.levels = levels
+        self.aging_interval = aging_interval
+        self._queues = [deque() for _ in range(levels)]
+        self._condition = Condition()
+        self._in_flight = 0
+        self._shutdown = False
+        # per-priority queue wait metrics
+        self._waits = [[] for _ in range(levels)]
+
+    def submit(self, fn, *args, priority=0, **kwargs):
+        """Queue fn(*args, **kwargs) at priority 0 (highest) to levels-1"""
+        if not 0 <= priority < self.levels:
+            raise ValueError(f'priority must be in 0..{self.levels - 1}')
+        future = Future()
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError('cannot submit after shutdown')
+            self._queues[priority].append(
+                (perf_counter(), future, fn, args, kwargs))
+            self._dispatch()
+        return future
+
+    def _effective_priority(self, level, now):
+        # the oldest task in a level decides how far that level has aged
+        queued_at = self._queues[level][0][0]
+        return level - (now - queued_at) / self.aging_interval
+
+    def _dispatch(self):
+        # called with the condition held, fill every free worker
+        while self._in_flight < self.max_workers:
+            now = perf_counter()
+            ready = [level for level in range(self.levels) if self._queues[level]]
+            if not ready:
+                break
+            level = min(ready, key=lambda lv: self._effective_priority(lv, now))
+            queued_at, future, fn, args, kwargs = self._queues[level].popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            self._waits[level].append(now - queued_at)
+            try:
+                inner = self._executor.submit(fn, *args, **kwargs)
+            except RuntimeError as e:
+                # the pool was shut down
+                future.set_exception(e)
+                continue
+            self._in_flight += 1
+            inner.add_done_callback(
+                lambda done, outer=future: self._on_done(done, outer))
+        self._condition.notify_all()
+
+    def _on_done(self, inner, outer):
+        # copy the outcome, then dispatch the next task to the free worker
+        if inner.exception() is not None:
+            outer.set_exception(inner.exception())
+        else:
+            outer.set_result(inner.result())
+        with self._condition:
+            self._in_flight -= 1
+            self._dispatch()
+
+    def get_stats(self):
+        """Get per-priority queue wait statistics"""
+        with self._condition:
+            stats = {}
+            for level, waits in enumerate(self._waits):
+                stats[level] = {
+                    'dispatched': len(waits),
+                    'queued': len(self._queues[level]),
+                    'mean_wait': sum(waits) / len(waits) if waits else 0.0,
+                    'max_wait': max(waits, default=0.0),
+                }
+            return stats
+
+    def shutdown(self, wait=True):
+        """Stop accepting tasks, waiting for queued tasks or cancelling them"""
+        with self._condition:
+            self._shutdown = True
+            if wait:
+                self._condition.wait_for(
+                    lambda: not any(self._queues) and self._in_flight == 0)
+            else:
+                # queued tasks could never reach the closed pool
+                for queue in self._queues:
+                    for _, future, _, _, _ in queue:
+                        future.cancel()
+                    queue.clear()
+                self._condition.notify_all()
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown(wait=True)
+
+# task executed in a worker process
+def work_task(name, duration):
+    """Task that simulates work of a given duration"""
+    sleep(duration)
+    return f'{name} done by {os.getpid()}'
+
+# Example 1: interactive tasks jump ahead of queued batch jobs
+def priority_example():
+    print('=== Priority Scheduling Example ===')
+    start = perf_counter()
+    with PriorityProcessPoolExecutor(max_workers=2, aging_interval=2.0) as executor:
+        batch = [executor.submit(work_task, f'batch-{i}', 0.3, priority=2)
+                 for i in range(10)]
+        sleep(0.1)
+        interactive = [executor.submit(work_task, f'interactive-{i}', 0.05,
+            priority=0) for i in range(3)]
+        for future in interactive:
+            print(f'{future.result()} at {perf_counter() - start:.2f}s')
+        for future in batch:
+            future.result()
+        print(f'Batch finished at {perf_counter() - start:.2f}s')
+        for level, stats in executor.get_stats().items():
+            print(f'  priority {level}: {stats["dispatched"]} tasks, '
+                  f'mean wait {stats["mean_wait"]:.2f}s, '
+                  f'max wait {stats["max_wait"]:.2f}s')
+    print()
+
+# Example 2: aging lets low priority work through a steady high priority load
+def aging_example():
+    print('=== Aging Example ===')
+    start = perf_counter()
+    with PriorityProcessPoolExecutor(max_workers=1, aging_interval=0.5) as executor:
+        executor.submit(work_task, 'warmup', 0.1, priority=0)
+        low = executor.submit(work_task, 'low', 0.01, priority=2)
+        # a new high priority task arrives as fast as the worker can serve them
+        high = []
+        while not low.done():
+            high.append(executor.submit(work_task, f'high-{len(high)}', 0.1,
+                priority=0))
+            sleep(0.1)
+        print(f'Low priority task ran at {perf_counter() - start:.2f}s, '
+              f'after {sum(f.done() for f in high)} high priority tasks')
+    print()
+
+# protect the entry point
+if __name__ == '__main__':
+    priority_example()
+    aging_example()
@@ -0,0 +1,222 @@
+# SuperFastPython.com
+# example of profiling inside process pool workers and merging the results
+from concurrent.futures import ProcessPoolExecutor, Future
+from collections import Counter
+from multiprocessing.util import Finalize
+from threading import Thread, Event, Lock, main_thread
+from tempfile import mkdtemp
+from shutil import rmtree
+from time import time, perf_counter
+import cProfile
+import pstats
+import pickle
+import sys
+import os
+from process_executor_examples import cpu_bound_task, chunked_task
+
+"""
+Why profile in the workers?
+cProfile in the parent only sees the parent waiting on futures. The real work
+happens in the workers, so each worker needs its own profiler.
+ProfilingProcessPoolExecutor installs one in every worker through the pool
+initializer:
+  'cprofile': a cProfile.Profile that is enabled only while a task runs
+  'sampling': a thread that records the function running on the worker's main
+              thread every interval seconds, which costs far less than cProfile
+Each worker writes its stats to a file when it exits (via a multiprocessing
+Finalize hook) and the parent merges the files after shutdown.
+Each task's time is also split into:
+  compute: time inside fn
+  serialize: pickling and unpickling the arguments and the result
+  ipc_wait: time on the call and result queues, measured with time.time()
+            because it is comparable across processes on the same host
+To measure serialization, the executor pickles the arguments and the result
+itself and sends bytes through the pool.
+"""
+
+# profiler state in each worker
+_profiler = None
+_samples = None
+
+def _sample_loop(stop, interval):
+    # record the innermost function of the main thread
+    ident = main_thread().ident
+    while not stop.wait(interval):
+        frame = sys._current_frames().get(ident)
+        if frame is not None:
+            code = frame.f_code
+            _samples[(code.co_filename, code.co_firstlineno, code.co_name)] += 1
+
+def _dump_profile(profile_dir, kind, stop):
+    path = os.path.join(profile_dir, f'worker-{os.getpid()}.{kind}')
+    if kind == 'cprofile':
+        _profiler.dump_stats(path)
+    else:
+        stop.set()
+        with open(path, 'wb') as file:
+            pickle.dump(dict(_samples), file)
+
+def _init_profiler(profile_dir, kind, interval):
+    """Pool initializer: start a profiler and dump it when the worker exits"""
+    global _profiler, _samples
+    stop = Event()
+    if kind == 'cprofile':
+        _profiler = cProfile.Profile()
+    else:
+        _samples = Counter()
+        Thread(target=_sample_loop, args=(stop, interval), daemon=True).start()
+    Finalize(None, _dump_profile, args=(profile_dir, kind, stop),
+             exitpriority=10)
+
+def _profiled_call(payload, sent_at):
+    """Run in the worker: unpickle, run, pickle and time each step"""
+    started_at = time()
+    start = perf_counter()
+    fn, args, kwargs = pickle.loads(payload)
+    unpickled = perf_counter()
+    if _profiler is not None:
+        _profiler.enable()
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        if _profiler is not None:
+            _profiler.disable()
+    computed = perf_counter()
+    data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+    timings = {
+        'pid': os.getpid(),
+        'queue_in': started_at - sent_at,
+        'unpickle_args': unpickled - start,
+        'compute': computed - unpickled,
+        'pickle_result': perf_counter() - computed,
+    }
+    return data, timings, time()
+
+class ProfilingProcessPoolExecutor(ProcessPoolExecutor):
+    """ProcessPoolExecutor that profiles its workers"""
+
+    def __init__(self, max_workers=None, profiler='cprofile', interval=0.005):
+        if profiler not in ('cprofile', 'sampling'):
+            raise ValueError(f'unknown profiler {profiler!r}')
+        self.profiler = profiler
+        self.profile_dir = mkdtemp(prefix='worker-profiles-')
+        self.task_timings = []
+        self._lock = Lock()
+        super().__init__(max_workers=max_workers, initializer=_init_profiler,
+            initargs=(self.profile_dir, profiler, interval))
+
+    def submit(self, fn, *args, **kwargs):
+        start = perf_counter()
+        payload = pickle.dumps((fn, args, kwargs),
+            protocol=pickle.HIGHEST_PROTOCOL)
+        pickle_args = perf_counter() - start
+        outer = Future()
+        inner = super().submit(_profiled_call, payload, time())
+
+        def on_outer_done(done):
+            # cancelling the returned future, as map() does on timeout,
+            # cancels the task if it has not started
+            if done.cancelled():
+                inner.cancel()
+                # wake wait() and as_completed(), as the executor does
+                done.set_running_or_notify_cancel()
+
+        inner.add_done_callback(
+            lambda done: self._on_done(done, outer, pickle_args))
+        outer.add_done_callback(on_outer_done)
+        return outer
+
+    def _on_done(self, inner, outer, pickle_args):
+        if inner.cancelled():
+            outer.cancel()
+            return
+        if outer.cancelled():
+            return
+        if inner.exception() is not None:
+            outer.set_exception(inner.exception())
+            return
+        data, timings, sent_at = inner.result()
+        queue_out = time() - sent_at
+        start = perf_counter()
+        try:
+            result = pickle.loads(data)
+        except Exception as e:
+            outer.set_exception(e)
+            return
+        timings['pickle_args'] = pickle_args
+        timings['unpickle_result'] = perf_counter() - start
+        timings['queue_out'] = queue_out
+        with self._lock:
+            self.task_timings.append(timings)
+        outer.set_result(result)
+
+    def timing_summary(self):
+        """Total compute, serialization and IPC wait across all tasks"""
+        with self._lock:
+            timings = list(self.task_timings)
+        return {
+            'tasks': len(timings),
+            'compute': sum(t['compute'] for t in timings),
+            'serialize': sum(t['pickle_args'] + t['unpickle_args']
+                + t['pickle_result'] + t['unpickle_result'] for t in timings),
+            'ipc_wait': sum(t['queue_in'] + t['queue_out'] for t in timings),
+        }
+
+    def report(self, top=8):
+        """Print the merged profile with a per-PID breakdown"""
+        names = sorted(os.listdir(self.profile_dir))
+        print(f'--- Merged {self.profiler} profile of {len(names)} workers ---')
+        if self.profiler == 'cprofile':
+            merged = None
+            for name in names:
+                stats = pstats.Stats(os.path.join(self.profile_dir, name))
+                print(f'  {name}: {stats.total_calls} calls, '
+                      f'{stats.total_tt:.3f}s')
+                merged = stats if merged is None else merged.add(stats)
+            if merged is not None:
+                merged.sort_stats('cumulative').print_stats(top)
+        else:
+            merged = Counter()
+            for name in names:
+                with open(os.path.join(self.profile_dir, name), 'rb') as file:
+                    samples = Counter(pickle.load(file))
+                print(f'  {name}: {sum(samples.values())} samples')
+                merged.update(samples)
+            total = sum(merged.values()) or 1
+            for (filename, line, func), count in merged.most_common(top):
+                print(f'  {count / total:6.1%} {func} '
+                      f'({os.path.basename(filename)}:{line})')
+        summary = self.timing_summary()
+        print(f'Task time split over {summary["tasks"]} tasks: '
+              f'compute {summary["compute"]:.3f}s, '
+              f'serialize {summary["serialize"]:.3f}s, '
+              f'ipc_wait {summary["ipc_wait"]:.3f}s')
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        super().shutdown(wait=wait, cancel_futures=cancel_futures)
+        if wait and os.path.isdir(self.profile_dir):
+            self.report()
+            rmtree(self.profile_dir)
+
+# Example 1: cProfile in every worker
+def cprofile_example():
+    print('=== cProfile Workers Example ===')
+    with ProfilingProcessPoolExecutor(max_workers=4) as executor:
+        list(executor.map(cpu_bound_task, [200000] * 8))
+    print()
+
+# Example 2: low-overhead sampling in every worker
+def sampling_example():
+    print('=== Sampling Workers Example ===')
+    data = list(range(400))
+    chunks = [data[i:i + 50] for i in range(0, len(data), 50)]
+    with ProfilingProcessPoolExecutor(max_workers=4,
+                                      profiler='sampling') as executor:
+        list(executor.map(chunked_task, chunks))
+        list(executor.map(cpu_bound_task, [500000] * 4))
+    print()
+
+# protect the entry point
+if __name__ == '__main__':
+    cprofile_example()
+    sampling_example()
@@ -0,0 +1,155 @@
+# SuperFastPython.com
+# example of returning results as packed column batches instead of dicts
+from concurrent.futures import ProcessPoolExecutor
+from collections import namedtuple
+from array import array
+from time import perf_counter, time
+import pickle
+import os
+
+"""
+Why not a dict per result?
+task_with_callback() returns {'task_id': ..., 'result': ..., 'process_id': ...,
+'timestamp': ...}. Every result pickles its four keys again, and the parent
+builds a new dict with four boxed values for each one.
+A ResultBatch has a fixed schema of (name, typecode) columns, where the
+typecode is an array module code such as 'q' (int64) or 'd' (float64). A worker
+appends many records to one batch, and each column is an array.array of raw
+machine values.
+When the batch is pickled, the columns are written into one bytes buffer, each
+padded to 8 bytes, so the result crosses the pipe as the schema plus a single
+blob. The parent does not unpack anything up front. Columns are memoryview
+casts over the buffer, and records are only built as namedtuples when you
+iterate, so column(name) gives whole-column access with no objects at all.
+Only fixed-size numeric columns are supported. Batches are unpacked on the
+same host, so the native byte order is used.
+"""
+
+class ResultBatch:
+    """Typed columns of records, packed into one buffer for transfer"""
+
+    def __init__(self, schema):
+        self.schema = tuple(schema)
+        self._columns = {name: array(code) for name, code in self.schema}
+        self._count = 0
+
+    def append(self, *values):
+        for (name, _), value in zip(self.schema, values, strict=True):
+            self._columns[name].append(value)
+        self._count += 1
+
+    def __len__(self):
+        return self._count
+
+    def column(self, name):
+        """A whole column, as an array or a memoryview"""
+        return self._columns[name]
+
+    def record_type(self):
+        return _record_type(tuple(name for name, _ in self.schema))
+
+    def __iter__(self):
+        # build each record on demand
+        record = self.record_type()
+        columns = [self._columns[name] for name, _ in self.schema]
+        for i in range(self._count):
+            yield record(*[column[i] for column in columns])
+
+    def __reduce__(self):
+        return (_unpack, (self.schema, self._count, self.pack()))
+
+    def pack(self):
+        parts = []
+        for name, _ in self.schema:
+            data = self._columns[name].tobytes()
+            parts.append(data + bytes(-len(data) % 8))
+        return b''.join(parts)
+
+def _unpack(schema, count, buffer):
+    """Rebuild a batch as column views over the packed buffer"""
+    batch = ResultBatch.__new__(ResultBatch)
+    batch.schema = schema
+    batch._count = count
+    batch._columns = {}
+    view = memoryview(buffer)
+    offset = 0
+    for name, code in schema:
+        size = array(code).itemsize * count
+        batch._columns[name] = view[offset:offset + size].cast(code)
+        offset += size + (-size % 8)
+    return batch
+
+_record_types = {}
+
+def _record_type(names):
+    if names not in _record_types:
+        _record_types[names] = namedtuple('Record', names)
+    return _record_types[names]
+
+# the schema of task_with_callback() results
+TASK_SCHEMA = (('task_id', 'q'), ('result', 'q'), ('process_id', 'i'),
+               ('timestamp', 'd'))
+
+# tasks executed in a worker process
+def dict_results(task_ids):
+    """One dict per result, as task_with_callback() returns"""
+    return [{'task_id': task_id, 'result': task_id * 10,
+             'process_id': os.getpid(), 'timestamp': time()}
+            for task_id in task_ids]
+
+def batch_results(task_ids):
+    """The same results as one packed batch"""
+    batch = ResultBatch(TASK_SCHEMA)
+    pid = os.getpid()
+    for task_id in task_ids:
+        batch.append(task_id, task_id * 10, pid, time())
+    return batch
+
+# Example 1: bytes on the wire and parent-side unpickling
+def wire_size_example(n=100000):
+    print('=== Result Batch Size Example ===')
+    task_ids = range(n)
+    # one pickle per result, as with a future per task_with_callback() call
+    messages = [pickle.dumps(result) for result in dict_results(task_ids)]
+    start = perf_counter()
+    for data in messages:
+        pickle.loads(data)
+    elapsed = perf_counter() - start
+    print(f'dict per task: {sum(map(len, messages)) / n:.1f} bytes per '
+          f'result, unpickled in {elapsed * 1000:.1f}ms')
+    for name, results in [('list of dicts', dict_results(task_ids)),
+                          ('batch', batch_results(task_ids))]:
+        data = pickle.dumps(results)
+        start = perf_counter()
+        pickle.loads(data)
+        elapsed = perf_counter() - start
+        print(f'{name}: {len(data) / n:.1f} bytes per result, '
+              f'unpickled in {elapsed * 1000:.1f}ms')
+    print()
+
+# Example 2: batches through the executor, read lazily
+def executor_example(tasks=200000, chunk=10000):
+    print('=== Result Batch Executor Example ===')
+    chunks = [range(i, i + chunk) for i in range(0, tasks, chunk)]
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        start = perf_counter()
+        total = 0
+        for results in executor.map(dict_results, chunks):
+            total += sum(result['result'] for result in results)
+        print(f'dicts: total {total} in {perf_counter() - start:.2f}s')
+        start = perf_counter()
+        total = 0
+        for batch in executor.map(batch_results, chunks):
+            total += sum(batch.column('result'))
+        print(f'batch: total {total} in {perf_counter() - start:.2f}s')
+        # records are only built when iterated
+        batch = executor.submit(batch_results, range(3)).result()
+        for record in batch:
+            print(f'  Task {record.task_id} = {record.result} '
+                  f'(PID: {record.process_id})')
+    print()
+
+# protect the entry point
+if __name__ == '__main__':
+    wire_size_example()
+    executor_example()
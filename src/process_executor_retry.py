@@ -0,0 +1,149 @@
+# SuperFastPython.com
+# example of retrying failed tasks inside the worker process
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from random import random, uniform
+from time import sleep
+from process_executor_examples import error_task
+
+"""
+Why retry in the worker?
+Retrying from the parent means pickling the arguments again, queueing the task
+again and waiting for a free worker again, all for a call that may have failed
+for a moment.
+RetryPolicy runs inside the worker instead. The worker retries the call in
+place and only the final outcome travels back to the parent, along with the
+number of attempts, which is set on the future as future.attempts. A final
+failure is raised in the worker, with the count on the exception as
+error.attempts, so the worker traceback is kept as with ProcessPoolExecutor.
+Only exceptions listed in retry_on are retried, so a real bug (ValueError,
+TypeError, ...) fails straight away. The delay before attempt n is
+base_delay * 2 ** (n - 1), capped at max_delay, with "full jitter": a random
+delay between 0 and that value, so workers that failed together don't retry
+together.
+"""
+
+class RetryPolicy:
+    """Retry settings applied in the worker"""
+
+    def __init__(self, max_attempts=3, retry_on=(Exception,), base_delay=0.1,
+                 max_delay=2.0, jitter=True):
+        self.max_attempts = max_attempts
+        self.retry_on = tuple(retry_on)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def delay(self, attempt):
+        """Seconds to wait after the given failed attempt"""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return uniform(0, delay) if self.jitter else delay
+
+def _call_with_retry(policy, fn, args, kwargs):
+    """Run in the worker: call fn until it succeeds or the policy gives up"""
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return fn(*args, **kwargs), attempt
+        except Exception as e:
+            if (not isinstance(e, policy.retry_on)
+                    or attempt >= policy.max_attempts):
+                # raise here, so the executor attaches the worker traceback
+                _set_attempts(e, attempt)
+                raise
+            sleep(policy.delay(attempt))
+
+def _set_attempts(error, attempts):
+    try:
+        error.attempts = attempts
+    except AttributeError:
+        pass
+
+class RetryingProcessPoolExecutor(ProcessPoolExecutor):
+    """ProcessPoolExecutor that retries tasks inside the workers"""
+
+    def __init__(self, max_workers=None, retry=None, **kwargs):
+        super().__init__(max_workers=max_workers, **kwargs)
+        self.retry = retry or RetryPolicy()
+        self.total_attempts = 0
+
+    def submit(self, fn, *args, retry=None, **kwargs):
+        """Submit fn with the executor's retry policy, or the one given"""
+        policy = retry or self.retry
+        inner = super().submit(_call_with_retry, policy, fn, args, kwargs)
+        outer = type(inner)()
+
+        def on_done(done):
+            if done.cancelled():
+                outer.cancel()
+                return
+            error = done.exception()
+            if error is not None:
+                # attempts is set in the worker, 0 if the call never ran
+                outer.attempts = getattr(error, 'attempts', 0)
+                self.total_attempts += outer.attempts
+                if not outer.cancelled():
+                    outer.set_exception(error)
+                return
+            value, attempts = done.result()
+            outer.attempts = attempts
+            self.total_attempts += attempts
+            if not outer.cancelled():
+                outer.set_result(value)
+
+        def on_outer_done(done):
+            # cancelling the returned future, as map() does on timeout,
+            # cancels the task if it has not started
+            if done.cancelled():
+                inner.cancel()
+                # wake wait() and as_completed(), as the executor does
+                done.set_running_or_notify_cancel()
+
+        inner.add_done_callback(on_done)
+        outer.add_done_callback(on_outer_done)
+        return outer
+
+class TransientError(Exception):
+    """Failure that is likely to go away if the call is repeated"""
+
+# task executed in a worker process
+def flaky_task(task_id):
+    """Task that fails transiently about half the time"""
+    sleep(random() * 0.1)
+    if random() < 0.5:
+        raise TransientError(f'Task {task_id} hit a transient error')
+    return f'Task {task_id} succeeded'
+
+# Example 1: transient failures are retried in the worker
+def retry_example():
+    print('=== In-Worker Retry Example ===')
+    policy = RetryPolicy(max_attempts=5, retry_on=(TransientError,),
+                         base_delay=0.05)
+    with RetryingProcessPoolExecutor(max_workers=3, retry=policy) as executor:
+        futures = [executor.submit(flaky_task, i) for i in range(8)]
+        for future in as_completed(futures):
+            try:
+                print(f'✓ {future.result()} after {future.attempts} attempts')
+            except Exception as e:
+                print(f'✗ {e} after {future.attempts} attempts')
+        print(f'Total attempts: {executor.total_attempts} for {len(futures)} '
+              f'tasks')
+    print()
+
+# Example 2: errors outside the filter are not retried
+def no_retry_example():
+    print('=== Exception Filter Example ===')
+    policy = RetryPolicy(max_attempts=5, retry_on=(TransientError,))
+    with RetryingProcessPoolExecutor(max_workers=2, retry=policy) as executor:
+        futures = [executor.submit(error_task, i) for i in range(4)]
+        for future in futures:
+            try:
+                print(f'✓ {future.result()} after {future.attempts} attempts')
+            except ValueError as e:
+                print(f'✗ {e} after {future.attempts} attempt')
+    print()
+
+# protect the entry point
+if __name__ == '__main__':
+    retry_example()
+    no_retry_example()
@@ -0,0 +1,165 @@
+# SuperFastPython.com
+# example of exporting a task timeline across processes as a Chrome trace
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import _process_chunk
+from collections import deque
+from functools import partial
+from itertools import count
+from random import random
+from time import sleep, monotonic_ns
+import json
+import os
+
+"""
+Task lifecycle events
+Each task records six timestamps:
+  submit: submit() was called in the parent
+  dispatch: the parent started pickling the task to send it to a worker
+  pickup: a worker received the task, before unpickling its arguments
+  start: the worker has unpickled the task and calls fn
+  end: fn returned in the worker
+  received: the result arrived back in the parent
+submit to dispatch is waiting for a free worker, dispatch to pickup is pickling
+and sending the task, and pickup to start is unpickling the arguments. The
+dispatch and pickup timestamps come from a small marker passed before fn and
+its arguments: its __reduce__ runs when the parent pickles the task, and the
+function it reduces to runs when the worker unpickles it. The task is only
+pickled once, so tracing adds a few timestamps per task.
+map() is ProcessPoolExecutor.map(), so timeout and chunksize behave as usual.
+With chunksize > 1 each chunk is traced as one task.
+time.monotonic_ns() is used everywhere. On Linux, macOS and Windows it reads a
+system-wide clock, so timestamps from different processes can be compared.
+The worker's timestamps travel back with the result, so tracing adds no extra
+messages. The parent keeps each finished task as one small tuple in a bounded
+deque, so the buffer's memory stays fixed even when tracing is left on.
+export_chrome_trace() writes the Trace Event Format that chrome://tracing and
+https://ui.perfetto.dev load, with one row per worker process. Queued tasks and
+results in transit belong to the parent and overlap from task to task, so they
+are written as async spans, which the viewers stack instead of nesting.
+"""
+
+class _Dispatch:
+    """Marker that timestamps the task as it is pickled and unpickled"""
+
+    def __reduce__(self):
+        # runs in the parent, when the task is pickled for a worker
+        return (_picked_up, (monotonic_ns(),))
+
+def _picked_up(dispatched):
+    # runs in the worker, before fn and its arguments are unpickled
+    return dispatched, monotonic_ns()
+
+def _traced_call(dispatch, fn, args, kwargs):
+    """Run in the worker: time the call of fn only"""
+    started = monotonic_ns()
+    result = fn(*args, **kwargs)
+    return result, os.getpid(), dispatch, started, monotonic_ns()
+
+def _task_name(fn):
+    # map() with chunksize submits partial(_process_chunk, fn)
+    if isinstance(fn, partial) and fn.func is _process_chunk:
+        return f'{_task_name(fn.args[0])} chunk'
+    return getattr(fn, '__name__', repr(fn))
+
+class TracingProcessPoolExecutor(ProcessPoolExecutor):
+    """ProcessPoolExecutor that records a timeline of every task"""
+
+    def __init__(self, max_workers=None, max_events=100000, **kwargs):
+        super().__init__(max_workers=max_workers, **kwargs)
+        self.events = deque(maxlen=max_events)
+        self._task_ids = count()
+
+    def submit(self, fn, *args, **kwargs):
+        task_id = next(self._task_ids)
+        submitted = monotonic_ns()
+        inner = super().submit(_traced_call, _Dispatch(), fn, args, kwargs)
+        # the returned future resolves to fn's result, not the trace tuple
+        outer = type(inner)()
+        name = _task_name(fn)
+
+        def on_done(done):
+            received = monotonic_ns()
+            if done.cancelled():
+                outer.cancel()
+                return
+            if done.exception() is not None:
+                if not outer.cancelled():
+                    outer.set_exception(done.exception())
+                return
+            result, pid, dispatch, started, ended = done.result()
+            dispatched, picked_up = dispatch
+            self.events.append((task_id, name, pid, submitted, dispatched,
+                                picked_up, started, ended, received))
+            if not outer.cancelled():
+                outer.set_result(result)
+
+        def on_outer_done(done):
+            # cancelling the returned future, as map() does on timeout,
+            # cancels the task if it has not started
+            if done.cancelled():
+                inner.cancel()
+                # wake wait() and as_completed(), as the executor does
+                done.set_running_or_notify_cancel()
+
+        inner.add_done_callback(on_done)
+        outer.add_done_callback(on_outer_done)
+        return outer
+
+    def export_chrome_trace(self, path):
+        """Write the recorded events as Chrome trace / Perfetto JSON"""
+        parent = os.getpid()
+        trace = [{'name': 'process_name', 'ph': 'M', 'pid': parent,
+                  'args': {'name': f'parent {parent}'}}]
+        workers = set()
+
+        def span(name, pid, tid, begin, end, task_id):
+            # trace timestamps are microseconds
+            trace.append({'name': name, 'ph': 'X', 'pid': pid, 'tid': tid,
+                          'ts': begin / 1000, 'dur': (end - begin) / 1000,
+                          'args': {'task_id': task_id}})
+
+        def async_span(name, category, begin, end, task_id):
+            for phase, ts in (('b', begin), ('e', end)):
+                trace.append({'name': name, 'cat': category, 'ph': phase,
+                              'id': task_id, 'pid': parent, 'tid': parent,
+                              'ts': ts / 1000})
+
+        for (task_id, name, pid, submitted, dispatched, picked_up, started,
+             ended, received) in list(self.events):
+            if pid not in workers:
+                workers.add(pid)
+                trace.append({'name': 'process_name', 'ph': 'M', 'pid': pid,
+                              'args': {'name': f'worker {pid}'}})
+            async_span(f'{name} #{task_id}', 'queued', submitted, dispatched,
+                       task_id)
+            async_span(f'{name} #{task_id}', 'task transfer', dispatched,
+                       picked_up, task_id)
+            span('unpickle args', pid, pid, picked_up, started, task_id)
+            span(f'{name} #{task_id}', pid, pid, started, ended, task_id)
+            async_span(f'{name} #{task_id}', 'result transfer', ended,
+                       received, task_id)
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, file)
+        return len(self.events)
+
+# task executed in a worker process
+def task_with_trace(task_id):
+    """Task with an occasional straggler"""
+    sleep(1.0 if task_id == 3 else random() * 0.3)
+    return task_id * 10
+
+# Example: record a run and write it out for chrome://tracing
+def trace_example():
+    print('=== Chrome Trace Example ===')
+    with TracingProcessPoolExecutor(max_workers=3) as executor:
+        results = list(executor.map(task_with_trace, range(12)))
+        path = 'process_executor_trace.json'
+        recorded = executor.export_chrome_trace(path)
+    print(f'Results: {results}')
+    print(f'Wrote {recorded} tasks to {path}, '
+          f'open it in chrome://tracing or https://ui.perfetto.dev')
+    print()
+
+# protect the entry point
+if __name__ == '__main__':
+    trace_example()
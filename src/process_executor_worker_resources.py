@@ -0,0 +1,181 @@
+# SuperFastPython.com
+# example of expensive resources built once per worker, not once per task
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.util import Finalize
+from contextlib import contextmanager
+from threading import Thread, Event, Lock
+from random import randint
+from time import sleep, monotonic, perf_counter
+import os
+
+"""
+Per-task vs per-worker resources
+A task that opens a database connection, builds a parser or loads a model pays
+for it on every call, and it is thrown away as soon as the task returns.
+Here the pool initializer install_resources() gives each worker a WorkerResources
+pool holding one ResourceSpec per resource name. Nothing is built until a task
+first asks for it:
+    with worker_resources().checkout('db') as connection:
+        ...
+After that the same object is handed to every later task on that worker.
+Idle eviction: a resource not checked out for max_idle seconds is torn down, so
+rarely used resources don't hold connections open. install_resources() starts a
+daemon thread that calls evict_idle() every evict_interval seconds (by default
+half the smallest max_idle), so a worker that goes idle still closes them.
+Checkouts and eviction share a lock, and a resource that is checked out, for
+example by an outer checkout, is never evicted. Teardown may therefore run on the
+eviction thread, so the resource must allow being closed from another thread.
+Teardown on exit: a multiprocessing Finalize hook tears down every resource that
+is still open when the worker process exits normally (executor shutdown, or
+max_tasks_per_child).
+"""
+
+class ResourceSpec:
+    """How to build and tear down one kind of resource"""
+
+    def __init__(self, factory, teardown=None, max_idle=None):
+        self.factory = factory
+        self.teardown = teardown
+        self.max_idle = max_idle
+
+class WorkerResources:
+    """Lazily built resources owned by one worker process"""
+
+    def __init__(self, specs):
+        self.specs = specs
+        self._resources = {}
+        self._last_used = {}
+        # checkouts not yet returned, per resource name
+        self._in_use = {}
+        self._lock = Lock()
+        self.created = 0
+
+    @contextmanager
+    def checkout(self, name):
+        with self._lock:
+            self._evict_idle()
+            if name not in self._resources:
+                self._resources[name] = self.specs[name].factory()
+                self.created += 1
+            self._last_used[name] = monotonic()
+            self._in_use[name] = self._in_use.get(name, 0) + 1
+            resource = self._resources[name]
+        try:
+            yield resource
+        finally:
+            with self._lock:
+                self._in_use[name] -= 1
+                self._last_used[name] = monotonic()
+
+    def evict_idle(self):
+        with self._lock:
+            self._evict_idle()
+
+    def _evict_idle(self):
+        now = monotonic()
+        for name in list(self._resources):
+            max_idle = self.specs[name].max_idle
+            if self._in_use.get(name):
+                continue
+            if max_idle is not None and now - self._last_used[name] > max_idle:
+                self._close(name)
+
+    def _close(self, name):
+        resource = self._resources.pop(name)
+        self._last_used.pop(name, None)
+        self._in_use.pop(name, None)
+        teardown = self.specs[name].teardown
+        if teardown is not None:
+            teardown(resource)
+
+    def close_all(self):
+        with self._lock:
+            for name in list(self._resources):
+                self._close(name)
+
+# the resource pool of this worker process
+_resources = None
+
+def _evict_loop(resources, stop, interval):
+    while not stop.wait(interval):
+        resources.evict_idle()
+
+def _close_resources(resources, stop):
+    stop.set()
+    resources.close_all()
+
+def install_resources(specs, evict_interval=None):
+    """Pool initializer: create this worker's resource pool"""
+    global _resources
+    _resources = WorkerResources(specs)
+    stop = Event()
+    if evict_interval is None:
+        idle = [spec.max_idle for spec in specs.values()
+                if spec.max_idle is not None]
+        evict_interval = min(idle) / 2 if idle else None
+    if evict_interval is not None:
+        Thread(target=_evict_loop, args=(_resources, stop, evict_interval),
+               daemon=True).start()
+    Finalize(_resources, _close_resources, args=(_resources, stop),
+             exitpriority=10)
+
+def worker_resources():
+    """The resource pool of the calling worker"""
+    if _resources is None:
+        raise RuntimeError('install_resources() was not used as the pool '
+                           'initializer')
+    return _resources
+
+# an expensive resource, such as a database connection
+class Connection:
+    def __init__(self):
+        sleep(0.5)  # simulate a slow connect
+        self.connection_id = randint(1000, 9999)
+        print(f'Worker {os.getpid()} opened connection {self.connection_id}',
+              flush=True)
+
+    def query(self, task_id):
+        sleep(0.05)
+        return f'Task {task_id} used connection {self.connection_id}'
+
+    def close(self):
+        print(f'Worker {os.getpid()} closed connection {self.connection_id}',
+              flush=True)
+
+def close_connection(connection):
+    connection.close()
+
+# tasks executed in a worker process
+def per_task_resource(task_id):
+    """Builds and closes the resource on every call"""
+    connection = Connection()
+    try:
+        return connection.query(task_id)
+    finally:
+        connection.close()
+
+def pooled_resource(task_id):
+    """Checks the resource out of the worker's pool"""
+    with worker_resources().checkout('db') as connection:
+        return connection.query(task_id)
+
+# Example: per-task setup vs per-worker resources
+def worker_resources_example():
+    print('=== Worker Resources Example ===')
+    start = perf_counter()
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        list(executor.map(per_task_resource, range(8)))
+    print(f'Per-task setup: {perf_counter() - start:.2f}s')
+    print()
+    specs = {'db': ResourceSpec(Connection, close_connection, max_idle=30.0)}
+    start = perf_counter()
+    with ProcessPoolExecutor(max_workers=2, initializer=install_resources,
+                             initargs=(specs,)) as executor:
+        for result in executor.map(pooled_resource, range(8)):
+            print(f'  {result}')
+    print(f'Per-worker resources: {perf_counter() - start:.2f}s')
+    print()
+
+# protect the entry point
+if __name__ == '__main__':
+    worker_resources_example()